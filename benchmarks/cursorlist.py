@@ -0,0 +1,96 @@
+#
+# cursorlist.py
+#
+# Author: Griffith Thomas
+# Copyright 2022 Spyderbat, Inc. All rights reserved.
+#
+
+"""
+Benchmarks moving the cursor of a CursorList and extending it with new
+records, for lists of increasing numbers of event_top snapshots.
+
+Usage:
+    python benchmarks/cursorlist.py [--sizes N ...] [--steps N]
+"""
+
+import argparse
+import random
+import time
+from typing import Callable, Dict, List
+
+from spydertop.utils.cursorlist import CursorList
+
+# the time between snapshots, in seconds
+INTERVAL = 15.0
+
+
+def snapshots(count: int, start: float = 0.0) -> List[Dict]:
+    """Make a list of records standing in for event_top snapshots"""
+    return [{"time": start + i * INTERVAL} for i in range(count)]
+
+
+def timed(action: Callable[[], None], repeat: int) -> float:
+    """Run an action repeatedly, returning the mean time in microseconds"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        action()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def run(size: int, steps: int) -> Dict[str, float]:
+    """Time the operations on a list of the given size"""
+    tops = CursorList("time", snapshots(size), INTERVAL * size / 2)
+    end = INTERVAL * size
+    results = {}
+
+    # playback moves the cursor forwards by a second at a time
+    cursor = [INTERVAL * size / 2]
+
+    def play():
+        cursor[0] += 1
+        tops.update_cursor(cursor[0])
+
+    results["play step"] = timed(play, steps)
+
+    # seeking moves the cursor to any time
+    times = [random.uniform(0, end) for _ in range(steps)]
+    seek_times = iter(times)
+    results["seek"] = timed(lambda: tops.update_cursor(next(seek_times)), steps)
+
+    # prefetching adds 5 minutes of records after the end of the list
+    added = [end]
+
+    def append():
+        tops.extend(snapshots(20, added[0]))
+        added[0] += 20 * INTERVAL
+
+    results["extend (after)"] = timed(append, max(steps // 100, 1))
+
+    # loading an earlier time span adds records before the end of the list
+    def insert():
+        tops.extend(snapshots(20, random.uniform(0, end) + 0.5))
+
+    results["extend (within)"] = timed(insert, max(steps // 100, 1))
+    return results
+
+
+def main():
+    """Run the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10_000, 100_000])
+    parser.add_argument("--steps", type=int, default=1000)
+    args = parser.parse_args()
+
+    random.seed(0)
+    rows = {size: run(size, args.steps) for size in args.sizes}
+    operations = list(next(iter(rows.values())))
+    print(f"{'snapshots':>16}" + "".join(f"{size:>12}" for size in args.sizes))
+    for operation in operations:
+        print(
+            f"{operation:>16}"
+            + "".join(f"{rows[size][operation]:>10.1f}us" for size in args.sizes)
+        )
+
+
+if __name__ == "__main__":
+    main()
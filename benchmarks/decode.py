@@ -0,0 +1,76 @@
+#
+# decode.py
+#
+# Author: Griffith Thomas
+# Copyright 2022 Spyderbat, Inc. All rights reserved.
+#
+
+"""
+Benchmarks decoding a capture in a single thread against decoding it
+with a pool of worker processes. The pool can only be faster with more
+than one core to run its workers on, and the decoded records are pickled
+back from the workers, which costs about as much as decoding them. The
+pool stays opt-in, with --decode-workers, until it is shown to be faster.
+
+Usage:
+    python benchmarks/decode.py [CAPTURE] [--workers N] [--repeat N]
+"""
+
+import argparse
+import gzip
+import os
+import time
+from typing import Dict, List
+
+from spydertop.utils.decode import RECORD_SCHEMAS, ChunkDecoder, is_newer, record_key
+from spydertop.utils.types import Record
+
+
+def run(lines: List[bytes], workers: int) -> float:
+    """Decode and merge the lines, returning the time taken in seconds"""
+    records: Dict[str, Dict[str, Record]] = {schema: {} for schema in RECORD_SCHEMAS}
+    top_ids = set()
+    decoder = ChunkDecoder(workers)
+    # start the pool before timing, as it is only started once per session
+    for _ in decoder.decode(lines[:1]):
+        pass
+
+    start = time.perf_counter()
+    for chunk in decoder.decode(lines):
+        for short_schema, record in chunk.records:
+            key = record_key(short_schema, record)
+            existing = records[short_schema].get(key)
+            if existing is None or is_newer(short_schema, record, existing):
+                records[short_schema][key] = record
+        top_ids.update(top["id"] for top in chunk.tops)
+    elapsed = time.perf_counter() - start
+
+    decoder.close()
+    return elapsed
+
+
+def main():
+    """Run the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "capture", nargs="?", default="examples/minikube-sock-shop.json.gz"
+    )
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="times to repeat the capture's lines"
+    )
+    args = parser.parse_args()
+
+    opener = gzip.open if args.capture.endswith(".gz") else open
+    with opener(args.capture, "rb") as file:
+        lines = file.read().split(b"\n") * args.repeat
+
+    print(f"{len(lines)} lines from {args.capture}, {os.cpu_count()} cores")
+    serial = run(lines, 0)
+    print(f"single thread: {serial:.3f}s")
+    parallel = run(lines, args.workers)
+    print(f"{args.workers} workers:     {parallel:.3f}s ({serial / parallel:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
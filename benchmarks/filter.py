@@ -0,0 +1,83 @@
+#
+# filter.py
+#
+# Author: Griffith Thomas
+# Copyright 2022 Spyderbat, Inc. All rights reserved.
+#
+
+"""
+Benchmarks filtering the rows of a table of connections with column
+matches, with and without the indexes over the columns, for a table of
+synthetic rows. The indexes are built by the first filter after the rows
+are set, and used by the filters after it, such as while a filter is typed.
+
+Usage:
+    python benchmarks/filter.py [--rows N] [--repeat N]
+"""
+
+import argparse
+import random
+import time
+from typing import Any, List, Tuple
+
+from spydertop.constants.columns import CONNECTION_COLUMNS
+from spydertop.utils.filters import ColumnIndexes, RowFilter
+
+FILTERS = [
+    "TXPACK: <1000",
+    "TXPACK: >30000",
+    "PROCESS: nginx",
+    "TXPACK: <20000 PROCESS: !nginx",
+    "TXPACK: >100 kube",
+]
+
+PROCESSES = ["nginx", "kube-proxy", "kubelet", "dockerd", "python3", "java"]
+
+
+def make_rows(count: int) -> List[Tuple[List[str], List[Any]]]:
+    """Make rows standing in for those of the connections tab"""
+    names = [col.header_name for col in CONNECTION_COLUMNS]
+    rows = []
+    for _ in range(count):
+        values: List[Any] = [None] * len(names)
+        values[names.index("TXPACK")] = random.randint(1, 40000)
+        values[names.index("PROCESS")] = random.choice(PROCESSES)
+        rows.append(([str(value or "") for value in values], values))
+    return rows
+
+
+def timed(rows: List, value: str, mode: str, repeat: int) -> float:
+    """Filter the rows repeatedly, returning the mean time in milliseconds.
+    The rows are scanned, indexed again before each filter as if they were
+    set again, or indexed once."""
+    indexes = ColumnIndexes(rows, CONNECTION_COLUMNS) if mode == "indexed" else None
+    start = time.perf_counter()
+    for _ in range(repeat):
+        if mode == "first":
+            indexes = ColumnIndexes(rows, CONNECTION_COLUMNS)
+        RowFilter(value, CONNECTION_COLUMNS, indexes).filter(rows)
+    return (time.perf_counter() - start) / repeat * 1e3
+
+
+def main():
+    """Run the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    random.seed(0)
+    rows = make_rows(args.rows)
+    modes = ["scan", "first", "indexed"]
+    print(f"{'filter':>32}" + "".join(f"{mode:>12}" for mode in modes))
+    for value in FILTERS:
+        print(
+            f"{value:>32}"
+            + "".join(
+                f"{timed(rows, value, mode, args.repeat):>10.1f}ms" for mode in modes
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
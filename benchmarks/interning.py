@@ -0,0 +1,94 @@
+#
+# interning.py
+#
+# Author: Griffith Thomas
+# Copyright 2022 Spyderbat, Inc. All rights reserved.
+#
+
+"""
+Reports the memory used by the records loaded from captures, with and
+without sharing the values repeated across records, and the time taken.
+
+Usage:
+    python benchmarks/interning.py [CAPTURE ...]
+"""
+
+import argparse
+import gc
+import gzip
+import time
+import tracemalloc
+from typing import Dict, List, Tuple
+
+from spydertop.utils.decode import (
+    RECORD_SCHEMAS,
+    ChunkDecoder,
+    RecordInterner,
+    is_newer,
+    record_key,
+)
+from spydertop.utils.types import Record
+
+DEFAULT_CAPTURES = [
+    "examples/minikube-node.json.gz",
+    "examples/minikube-sock-shop.json.gz",
+]
+
+
+def load(lines: List[bytes], intern: bool) -> Tuple[Dict, List[Record]]:
+    """Decode and merge the lines as the model does"""
+    records: Dict[str, Dict[str, Record]] = {schema: {} for schema in RECORD_SCHEMAS}
+    tops: List[Record] = []
+    interner = RecordInterner()
+    for chunk in ChunkDecoder().decode(lines):
+        for short_schema, record in chunk.records:
+            key = record_key(short_schema, record)
+            existing = records[short_schema].get(key)
+            if existing is None or is_newer(short_schema, record, existing):
+                records[short_schema][key] = (
+                    interner.intern_record(record) if intern else record
+                )
+        tops.extend(
+            interner.intern_record(top) if intern else top for top in chunk.tops
+        )
+    return records, tops
+
+
+def measure(lines: List[bytes], intern: bool) -> Tuple[int, float]:
+    """Load the lines, returning the bytes held by the loaded
+    records and the time taken in seconds"""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    loaded = load(lines, intern)
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del loaded
+    return size, elapsed
+
+
+def main():
+    """Run the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("captures", nargs="*", default=DEFAULT_CAPTURES)
+    args = parser.parse_args()
+
+    for capture in args.captures:
+        opener = gzip.open if capture.endswith(".gz") else open
+        with opener(capture, "rb") as file:
+            lines = file.read().split(b"\n")
+
+        print(f"{len(lines)} lines from {capture}")
+        plain, plain_time = measure(lines, False)
+        interned, interned_time = measure(lines, True)
+        print(f"  as decoded: {plain / 2**20:8.2f} MiB in {plain_time:.3f}s")
+        print(
+            f"  interned:   {interned / 2**20:8.2f} MiB in {interned_time:.3f}s"
+            f" ({1 - interned / plain:.0%} smaller)"
+        )
+
+
+if __name__ == "__main__":
+    main()
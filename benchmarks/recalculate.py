@@ -0,0 +1,126 @@
+#
+# recalculate.py
+#
+# Author: Griffith Thomas
+# Copyright 2022 Spyderbat, Inc. All rights reserved.
+#
+
+"""
+Benchmarks recalculating the cells of the processes table, as the main
+frame does each time the time moves, for a capture played back a second
+at a time.
+
+Usage:
+    python benchmarks/recalculate.py [CAPTURE] [--steps N] [--height N]
+        [--changed-only] [--by-column]
+
+With --height, only the cells of that many rows are formatted, as when
+the table formats the rows it displays; otherwise every cell is formatted.
+With --changed-only, only the columns which depend on something which
+changed since the previous step are recalculated, as the main frame does
+for the rows which stay visible.
+"""
+
+import argparse
+import gzip
+import time
+from typing import Dict, List, Optional
+
+from spydertop.config import Config
+from spydertop.constants.columns import PROCESS_COLUMNS, Column
+from spydertop.model import AppModel
+from spydertop.utils.types import Dependency, Record
+
+DEFAULT_CAPTURE = "examples/minikube-sock-shop.json.gz"
+
+
+def load(capture: str) -> AppModel:
+    """Load a capture into a model"""
+    opener = gzip.open if capture.endswith(".gz") else open
+    config = Config(None, None, opener(capture, "rt"), None, None, 900, False, "WARN")
+    model = AppModel(config)
+    # don't send usage logs for benchmark runs
+    model.log_api = lambda *_: None
+    model.load_data(None)
+    return model
+
+
+def hidden(model: AppModel, record: Record) -> bool:
+    """Whether the main frame hides the process with the current settings"""
+    return (
+        model.config["hide_kthreads"]
+        and record["type"] == "kernel thread"
+        or model.config["hide_threads"]
+        and record["type"] == "thread"
+    )
+
+
+def recalculate(  # pylint: disable=too-many-arguments
+    model: AppModel,
+    records: List[Record],
+    columns: List[Column],
+    totals: Dict,
+    height: Optional[int],
+) -> None:
+    """Get the cells of every record and format the cells of the
+    displayed records, adding the time spent on each column to totals"""
+    for col in columns:
+        start = time.perf_counter()
+        values = col.get_values(model, records)
+        for record, value in list(zip(records, values))[:height]:
+            col.format_value(model, record, value)
+        totals[col.header_name] += time.perf_counter() - start
+
+
+def main():
+    """Run the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("capture", nargs="?", default=DEFAULT_CAPTURE)
+    parser.add_argument("--steps", type=int, default=100)
+    parser.add_argument("--height", type=int, default=None)
+    parser.add_argument("--changed-only", action="store_true")
+    parser.add_argument("--by-column", action="store_true")
+    args = parser.parse_args()
+
+    model = load(args.capture)
+    timestamp = model.timestamp
+    columns = PROCESS_COLUMNS
+    totals = {col.header_name: 0.0 for col in columns}
+    rows = 0
+    top_ids = None
+    for _ in range(args.steps):
+        model.timestamp = timestamp
+        changed = Dependency.TIME
+        if (model.get_value("id"), model.get_value("id", previous=True)) != top_ids:
+            changed |= Dependency.RESOURCES
+            top_ids = (model.get_value("id"), model.get_value("id", previous=True))
+        records = [
+            record
+            for record in model.records_at(
+                "model_process", timestamp, model.time_elapsed
+            )
+            if not hidden(model, record)
+        ]
+        recalculate(
+            model,
+            records,
+            [col for col in columns if col.depends & changed]
+            if args.changed_only
+            else columns,
+            totals,
+            args.height,
+        )
+        rows += len(records)
+        timestamp += 1
+
+    print(
+        f"{rows / args.steps:.0f} processes, {len(columns)} columns: "
+        f"{sum(totals.values()) / args.steps * 1e3:.2f}ms per recalculation"
+    )
+    if args.by_column:
+        for name, total in sorted(totals.items(), key=lambda item: -item[1]):
+            print(f"{name:>16} {total / args.steps * 1e3:8.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -20,6 +20,12 @@ from spydertop.config import Config
 from spydertop.screens import start_screen
 
 from spydertop.utils import convert_to_seconds
+from spydertop.utils.capture import (
+    CAPTURE_SUFFIX,
+    MAGIC as CAPTURE_MAGIC,
+    CaptureReader,
+)
+from spydertop.utils.sidecar import IndexedFile
 
 
 class Timestamp(click.ParamType):
@@ -90,31 +96,39 @@ class Duration(click.ParamType):
 
 class FileOrUrl(click.ParamType):
     """
-    A text or gzipped file input, or a string url.
+    A text, gzipped, or capture file input, or a string url.
     Files will automatically be opened by the proper reader,
     and urls will be converted to a proper base url (with https, etc.)
     """
 
     name = "File or Url"
 
-    def convert(
+    def convert(  # pylint: disable=too-many-return-statements
         self, value: str, param: Optional[click.Parameter], ctx: Optional[click.Context]
     ):
         if not value:
             return None
         if exists(value):
             try:
-                # first, determine if it is JSON or GZIP
+                # first, determine if it is a capture, JSON, or GZIP
                 tmp = open(value, "rb")  # pylint: disable=consider-using-with
-                magic_bytes = tmp.read(2)
+                magic_bytes = tmp.read(len(CAPTURE_MAGIC))
                 tmp.close()
-                if magic_bytes == b"\x1f\x8b":
+                if magic_bytes == CAPTURE_MAGIC:
+                    # capture file detected
+                    return CaptureReader(value)
+                # use the time index for the file if it has one
+                compressed = magic_bytes[:2] == b"\x1f\x8b"
+                indexed = IndexedFile.open(value, compressed)
+                if indexed is not None:
+                    return indexed
+                if compressed:
                     # GZIP file detected
                     return gzip.open(value, "rt")
                 # other file detected, assuming JSON
                 return open(value, "r", encoding="utf-8")
 
-            except FileNotFoundError as exc:
+            except (FileNotFoundError, ValueError) as exc:
                 return self.fail(f"Unable to open file {value}: {exc}")
         else:
             # first see if it is a file, but a non-existent one
@@ -165,7 +179,30 @@ fetching records from the production Spyderbat API",
     "--output",
     "-o",
     type=click.File("w"),
-    help="If set, spydertop with use the specified output file to save the loaded records",
+    help=f"If set, spydertop with use the specified output file to save the loaded records. \
+Files ending in {CAPTURE_SUFFIX} are saved in an indexed format, which can be opened at \
+any time without reading the whole file",
+)
+@click.option(
+    "--decode-workers",
+    type=click.IntRange(min=0),
+    default=0,
+    help="Experimental. If set, records will be decoded by this many worker processes \
+instead of in the loading thread, which is not yet shown to be faster, as the decoded \
+records are copied back from the workers. Defaults to 0, decoding records in a single thread",
+)
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False),
+    help="The directory to cache data fetched from the API in. \
+Defaults to ~/.spyderbat-api/cache",
+)
+@click.option(
+    "--cache-size",
+    type=click.IntRange(min=0),
+    default=1024,
+    help="The maximum size of the API cache in MiB, after which the least recently \
+used data is removed. Set to 0 to disable the cache. Defaults to 1024",
 )
 @click.option(
     "--confirm/--no-confirm",
@@ -185,7 +222,17 @@ Defaults to WARN",
 @click.argument("timestamp", type=Timestamp(), required=False)
 @click.version_option()
 def cli(  # pylint: disable=too-many-arguments
-    organization, machine, input_file, output, timestamp, duration, confirm, log_level
+    organization,
+    machine,
+    input_file,
+    output,
+    timestamp,
+    duration,
+    decode_workers,
+    cache_dir,
+    cache_size,
+    confirm,
+    log_level,
 ):
     """
     Fetches data from the specified org and machine, or the defaults specified
@@ -214,6 +261,9 @@ def cli(  # pylint: disable=too-many-arguments
         duration,
         confirm,
         log_level,
+        decode_workers,
+        cache_dir,
+        cache_size,
     )
 
     start_screen(config)
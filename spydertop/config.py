@@ -27,6 +27,9 @@ from spydertop.constants.columns import (
     Column,
 )
 from spydertop.utils import log
+from spydertop.utils.cache import default_cache_dir
+from spydertop.utils.output import OutputWriter
+from spydertop.utils.stream import WindowedFile
 
 
 def dump_columns(columns: List[Column]) -> Dict[str, bool]:
@@ -46,10 +49,13 @@ class Config:  # pylint: disable=too-many-instance-attributes
     api_key: Optional[str]
     org: Optional[str]
     machine: Optional[str]
-    input: Union[str, TextIO]
-    output: Optional[TextIO]
+    input: Union[str, TextIO, WindowedFile]
+    output: Optional[Union[TextIO, OutputWriter]]
     start_time: Optional[datetime]
     start_duration: timedelta
+    decode_workers: int = 0
+    cache_dir: str
+    cache_size: int = 0
 
     # user confirmation
     org_confirmed: bool = False
@@ -75,16 +81,19 @@ class Config:  # pylint: disable=too-many-instance-attributes
     }
     settings_changed: bool = False
 
-    def __init__(  # pylint: disable=too-many-arguments
+    def __init__(  # pylint: disable=too-many-arguments,too-many-statements
         self,
         org: Optional[str],
         source: Optional[str],
-        f_input: Optional[Union[str, TextIO]],
+        f_input: Optional[Union[str, TextIO, WindowedFile]],
         output: Optional[TextIO],
         start_time: Optional[float],
         duration: int,
         confirm: bool,
         log_level: str,
+        decode_workers: int = 0,
+        cache_dir: Optional[str] = None,
+        cache_size: int = 0,
     ):
         # allow for logging from the underlying library
         # and saving to a file if it is requested
@@ -149,6 +158,9 @@ See --help for a list of valid log levels."
             self.output = output
             self.start_time = datetime.fromtimestamp(start_time) if start_time else None
             self.start_duration = timedelta(0, duration, 0)
+            self.decode_workers = decode_workers
+            self.cache_dir = cache_dir or default_cache_dir()
+            self.cache_size = cache_size
         except KeyError as exc:
             raise click.ClickException(
                 f"""Failed to parse config:
@@ -267,7 +279,7 @@ config:
         # this means we need to close it manually
         if self.input and not isinstance(self.input, str):
             self.input.close()
-        # if the output is a gzip file, we need to close it manually
+        # the output writer must be closed to write any queued records
         if self.output is not None and hasattr(self.output, "close"):
             self.output.close()
 
@@ -27,3 +27,13 @@ API_LOG_TYPES = {
     "navigation": "SpydertopNavigation",
     "account_created": "SpydertopAccountCreated",
 }
+
+# the short schema of the records shown in each tab
+TAB_SCHEMAS = {
+    "processes": "model_process",
+    "flags": "event_redflag",
+    "sessions": "model_session",
+    "connections": "model_connection",
+    "listening": "model_listening_socket",
+    "containers": "model_container",
+}
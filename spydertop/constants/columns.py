@@ -23,7 +23,14 @@ from spydertop.utils import (
     pretty_time,
     log,
 )
-from spydertop.utils.types import Alignment, Record, Bytes, Severity, Status
+from spydertop.utils.types import (
+    Alignment,
+    Bytes,
+    Dependency,
+    Record,
+    Severity,
+    Status,
+)
 from spydertop.constants import PAGE_SIZE
 
 # Note: this is a workaround to avoid circular imports
@@ -34,7 +41,7 @@ else:
     AppModel = Any
 
 
-class Column:
+class Column:  # pylint: disable=too-many-instance-attributes
     """
     Holds the information for processing and displaying a column.
     Values here work similarly to the values used in MUI DataGrid columns.
@@ -46,7 +53,9 @@ class Column:
     enabled: bool
     align: Alignment
     value_getter: Callable[[AppModel, Record], Any]
+    batch_getter: Optional[Callable[[AppModel, List[Record]], List[Any]]]
     value_formatter: Callable[[AppModel, Record, Any], str]
+    depends: Dependency
 
     def __init__(  # pylint: disable=too-many-arguments
         self,
@@ -58,6 +67,8 @@ class Column:
         field: Optional[str] = None,
         value_getter: Optional[Callable[[AppModel, Record], Any]] = None,
         value_formatter: Optional[Callable[[AppModel, Record, Any], str]] = None,
+        batch_getter: Optional[Callable[[AppModel, List[Record]], List[Any]]] = None,
+        depends: Optional[Dependency] = None,
     ) -> None:
         self.header_name = name
         self.max_width = max_width
@@ -69,7 +80,11 @@ class Column:
         )
         self.enabled = enabled
         str_field: str = field or name.lower()
-        if value_type is datetime:
+        self.batch_getter = batch_getter
+        if batch_getter is not None:
+            # a column calculated all at once can still provide single values
+            self.value_getter = value_getter or (lambda m, r: batch_getter(m, [r])[0])
+        elif value_type is datetime:
             self.value_getter = value_getter or (
                 lambda m, r: datetime.fromtimestamp(
                     float(r[str_field]), timezone.utc
@@ -80,6 +95,16 @@ class Column:
         else:
             self.value_getter = value_getter or (lambda m, r: value_type(r[str_field]))
         self.value_formatter = value_formatter or (lambda m, r, v: str(v))
+        # columns with their own functions may depend on anything, unless
+        # they say otherwise
+        if depends is not None:
+            self.depends = depends
+        elif value_getter or batch_getter or value_formatter:
+            self.depends = Dependency.ALL
+        elif value_type is datetime:
+            self.depends = Dependency.TIMEZONE
+        else:
+            self.depends = Dependency.RECORD
 
     def get_value(self, model: AppModel, record: Record) -> Any:
         """Returns the value for the column"""
@@ -92,6 +117,19 @@ class Column:
             log.traceback(err)
             return None
 
+    def get_values(self, model: AppModel, records: List[Record]) -> List[Any]:
+        """Returns the values for the column for each of the records, which
+        are calculated all at once if the column has a batch getter"""
+        if self.batch_getter is None:
+            return [self.get_value(model, record) for record in records]
+        try:
+            return self.batch_getter(model, records)
+        except (KeyError, TypeError, IndexError) as err:
+            # fall back to getting each value, so only the failed values are lost
+            log.debug(f"Getting values for {self.header_name} failed.")
+            log.traceback(err)
+            return [self.get_value(model, record) for record in records]
+
     def format_value(self, model: AppModel, record: Record, value: Any) -> str:
         """Returns the formatted value for the column"""
         if record is None or value is None:
@@ -107,47 +145,78 @@ class Column:
 ########################### Processes ###########################
 
 
-def get_cpu_per(model: AppModel, process: Record):
-    """Calculates the percentage of CPU time used by the process"""
-    record = get_resource_record(model, process)
-    prev_record = get_resource_record(model, process, previous=True)
-    if record is None or prev_record is None:
-        return None
-    time_delta = model.time_elapsed
+def get_resource_column(
+    model: AppModel, processes: List[Record], field: str, previous=False
+) -> List[Optional[float]]:
+    """Returns a field of the resource usage of each process, with None for
+    processes which have no resource usage at the current time"""
+    table = model.resource_table(previous)
+    if table is None:
+        return [None] * len(processes)
+    return table.get_column([process["pid"] for process in processes], field)
+
+
+def get_cpu_per(model: AppModel, processes: List[Record]):
+    """Calculates the percentage of CPU time used by each process"""
     clk_tck = model.get_value("clk_tck")
-    cpu = (
-        record["utime"] - prev_record["utime"] + record["stime"] - prev_record["stime"]
+    if clk_tck is None:
+        return [None] * len(processes)
+    scale = 100 / model.time_elapsed / clk_tck
+    columns = zip(
+        get_resource_column(model, processes, "utime"),
+        get_resource_column(model, processes, "stime"),
+        get_resource_column(model, processes, "utime", previous=True),
+        get_resource_column(model, processes, "stime", previous=True),
     )
-    cpu /= time_delta
-    cpu /= clk_tck
-    cpu = round(cpu * 100, 1)
-    return cpu
+    return [
+        round((utime - prev_utime + stime - prev_stime) * scale, 1)
+        if None not in (utime, stime, prev_utime, prev_stime)
+        else None
+        for utime, stime, prev_utime, prev_stime in columns
+    ]
 
 
-def get_mem_per(model: AppModel, process: Record):
-    """Formats the percentage of memory used by the process"""
-    record = get_resource_record(model, process)
-    if record is None:
-        return None
-    mem = record["rss"] * PAGE_SIZE
+def get_mem_per(model: AppModel, processes: List[Record]):
+    """Calculates the percentage of memory used by each process"""
     mem_model = model.memory
-    if mem_model:
-        mem /= mem_model["MemTotal"]
-    else:
-        mem = 0
-    mem = round(mem * 100, 1)
-    return mem
+    scale = PAGE_SIZE / mem_model["MemTotal"] * 100 if mem_model else 0
+    return [
+        round(rss * scale, 1) if rss is not None else None
+        for rss in get_resource_column(model, processes, "rss")
+    ]
 
 
-def get_time_plus_value(model: AppModel, process: Record):
-    """Returns the time spent in the process"""
-    record = get_resource_record(model, process)
-    if record is None:
-        return None
+def get_time_plus_value(model: AppModel, processes: List[Record]):
+    """Returns the time spent in each process"""
     clk_tck = model.get_value("clk_tck")
-    cpu = record["utime"] + record["stime"]
-    time = cpu / clk_tck
-    return timedelta(seconds=time)
+    if clk_tck is None:
+        return [None] * len(processes)
+    return [
+        timedelta(seconds=(utime + stime) / clk_tck)
+        if utime is not None and stime is not None
+        else None
+        for utime, stime in zip(
+            get_resource_column(model, processes, "utime"),
+            get_resource_column(model, processes, "stime"),
+        )
+    ]
+
+
+def get_bytes_column(field: str) -> Callable[[AppModel, List[Record]], List[Any]]:
+    """Creates a batch getter for a resource usage field measured in bytes"""
+    return lambda m, xs: [
+        map_optional(Bytes, value) for value in get_resource_column(m, xs, field)
+    ]
+
+
+def get_ages(field: str) -> Callable[[AppModel, List[Record]], List[timedelta]]:
+    """Creates a batch getter for the time since a time field of each record"""
+
+    def batch_getter(model: AppModel, records: List[Record]) -> List[timedelta]:
+        now = model.timestamp
+        return [timedelta(seconds=now - record[field]) for record in records]
+
+    return batch_getter
 
 
 def color_cmd(_m, process: Record, args: List[str]):
@@ -179,19 +248,13 @@ def format_container(model: AppModel, _p, container: str):
 [{color}{container_rec['container_state']}${{-1,0}}]"
 
 
-def get_resource_record(
-    model: AppModel, process_record: Record, previous=False
-) -> Optional[Record]:
-    """Returns the resource record for the process"""
-    process_table = model.get_value("processes", previous)
-    if process_table is None:
-        return None
-    default_values = process_table["default"]
-    if str(process_record["pid"]) not in process_table:
+def get_resource(model: AppModel, process_record: Record, field: str) -> Any:
+    """Returns a field of the resource usage of the process, or None if the
+    process has no resource usage at the current time"""
+    record = model.resource_record(process_record["pid"])
+    if record is None:
         return None
-    record = default_values.copy()
-    record.update(process_table[str(process_record["pid"])])
-    return record
+    return record[field]
 
 
 PROCESS_COLUMNS = [
@@ -205,6 +268,7 @@ PROCESS_COLUMNS = [
         str,
         field="euser",
         value_formatter=lambda m, r, x: x if x != "root" else "${8,1}root",
+        depends=Dependency.RECORD,
     ),
     Column(
         "AUSER",
@@ -213,6 +277,7 @@ PROCESS_COLUMNS = [
         field="auser",
         value_formatter=lambda m, r, x: x if x != "SYSTEM" else "${8,1}SYSTEM",
         enabled=False,
+        depends=Dependency.RECORD,
     ),
     Column(
         "START_TIME",
@@ -226,58 +291,52 @@ PROCESS_COLUMNS = [
         "PRI",
         3,
         int,
-        value_getter=lambda m, x: map_optional(
-            (lambda x: int(x["priority"])), get_resource_record(m, x)
-        ),
+        value_getter=lambda m, x: map_optional(int, get_resource(m, x, "priority")),
         value_formatter=lambda m, r, x: str(x) if x is not None else "${8,1}?",
+        depends=Dependency.RESOURCES,
     ),
     Column(
         "NI",
         3,
         int,
-        value_getter=lambda m, x: map_optional(
-            (lambda x: int(x["nice"])), get_resource_record(m, x)
-        ),
+        value_getter=lambda m, x: map_optional(int, get_resource(m, x, "nice")),
         value_formatter=lambda m, r, x: str(x) if x is not None else "${8,1}?",
+        depends=Dependency.RESOURCES,
     ),
     Column(
         "VIRT",
         5,
         Bytes,
         align=Alignment.RIGHT,
-        value_getter=lambda m, x: map_optional(
-            (lambda x: Bytes(x["vsize"])), get_resource_record(m, x)
-        ),
+        batch_getter=get_bytes_column("vsize"),
+        depends=Dependency.RESOURCES,
     ),
     Column(
         "RES",
         5,
         Bytes,
         align=Alignment.RIGHT,
-        value_getter=lambda m, x: map_optional(
-            (lambda x: Bytes(x["rss"])), get_resource_record(m, x)
-        ),
+        batch_getter=get_bytes_column("rss"),
+        depends=Dependency.RESOURCES,
     ),
     Column(
         "SHR",
         5,
         Bytes,
         align=Alignment.RIGHT,
-        value_getter=lambda m, x: map_optional(
-            (lambda x: Bytes(x["shared"])), get_resource_record(m, x)
-        ),
+        batch_getter=get_bytes_column("shared"),
+        depends=Dependency.RESOURCES,
     ),
     Column(
         "S",
         1,
         Status,
-        value_getter=lambda m, x: map_optional(
-            (lambda x: Status(x["state"])), get_resource_record(m, x)
-        )
+        value_getter=lambda m, x: map_optional(Status, get_resource(m, x, "state"))
         or Status.UNKNOWN,
         value_formatter=lambda m, r, x: "${8,1}" + str(x)
         if x != Status.RUNNING
         else "${2}R",
+        depends=Dependency.RESOURCES,
     ),
     Column(
         "TYPE",
@@ -287,6 +346,7 @@ PROCESS_COLUMNS = [
         if x["type"] != "kernel thread"
         else "kthread",
         enabled=False,
+        depends=Dependency.RECORD,
     ),
     Column(
         "I",
@@ -294,37 +354,42 @@ PROCESS_COLUMNS = [
         bool,
         field="interactive",
         value_formatter=lambda m, r, x: "${2}Y" if x else "${1}N",
+        depends=Dependency.RECORD,
     ),
     Column(
         "CPU%",
         4,
         float,
-        value_getter=get_cpu_per,
+        batch_getter=get_cpu_per,
         value_formatter=lambda m, r, x: f"{x:4.1f}",
+        depends=Dependency.RESOURCES,
     ),
     Column(
         "MEM%",
         4,
         float,
-        value_getter=get_mem_per,
+        batch_getter=get_mem_per,
         value_formatter=lambda m, r, x: f"{x:4.1f}",
+        depends=Dependency.RESOURCES,
     ),
     Column(
         "TIME+",
         9,
         timedelta,
         align=Alignment.RIGHT,
-        value_getter=get_time_plus_value,
+        batch_getter=get_time_plus_value,
         value_formatter=lambda m, r, x: pretty_time(x.total_seconds()),
+        depends=Dependency.RESOURCES,
     ),
     Column(
         "ELAPSED",
         9,
         timedelta,
         align=Alignment.RIGHT,
-        value_getter=lambda m, x: timedelta(seconds=m.timestamp - x["valid_from"]),
+        batch_getter=get_ages("valid_from"),
         value_formatter=lambda m, r, x: pretty_time(x.total_seconds()),
         enabled=False,
+        depends=Dependency.TIME,
     ),
     Column(
         "ANCESTORS",
@@ -333,6 +398,7 @@ PROCESS_COLUMNS = [
         value_getter=lambda m, x: x.get("ancestors", None) or [],
         value_formatter=lambda m, r, x: "/".join(x),
         enabled=False,
+        depends=Dependency.RECORD,
     ),
     Column("CGROUP", 20, str, enabled=False),
     Column(
@@ -344,6 +410,7 @@ PROCESS_COLUMNS = [
             x.get("container"),
         ),
         enabled=False,
+        depends=Dependency.RELATED,
     ),
     Column(
         "CONTAINER_IMAGE",
@@ -353,6 +420,7 @@ PROCESS_COLUMNS = [
             lambda x: m.containers.get(x, {}).get("image"), x.get("container")
         ),
         enabled=False,
+        depends=Dependency.RELATED,
     ),
     Column(
         "ENVIRONMENT",
@@ -361,12 +429,31 @@ PROCESS_COLUMNS = [
         field="environ",
         value_formatter=format_environ,
         enabled=False,
+        depends=Dependency.RECORD,
+    ),
+    Column(
+        "Command",
+        0,
+        list,
+        field="args",
+        value_formatter=color_cmd,
+        depends=Dependency.RECORD,
     ),
-    Column("Command", 0, list, field="args", value_formatter=color_cmd),
 ]
 
 ########################### Sessions ###########################
 
+
+def get_session_durations(model: AppModel, sessions: List[Record]):
+    """Returns the time each session has been open, or was open for
+    if it has expired"""
+    now = model.timestamp
+    return [
+        timedelta(seconds=min(now, session["expire_at"]) - session["valid_from"])
+        for session in sessions
+    ]
+
+
 SESSION_COLUMNS = [
     Column("ID", 30, str, enabled=False),
     Column("EUID", 6, int),
@@ -375,6 +462,7 @@ SESSION_COLUMNS = [
         9,
         str,
         value_formatter=lambda m, s, x: x if x != "root" else "${8,1}root",
+        depends=Dependency.RECORD,
     ),
     Column("AUID", 6, int, enabled=False),
     Column(
@@ -383,6 +471,7 @@ SESSION_COLUMNS = [
         str,
         value_formatter=lambda m, s, x: x if x != "root" else "${8,1}root",
         enabled=False,
+        depends=Dependency.RECORD,
     ),
     Column(
         "PARENT",
@@ -393,6 +482,7 @@ SESSION_COLUMNS = [
         if x in m.sessions
         else "",
         enabled=False,
+        depends=Dependency.RELATED,
     ),
     Column("START_TIME", 27, datetime, align=Alignment.RIGHT, field="valid_from"),
     Column(
@@ -400,10 +490,9 @@ SESSION_COLUMNS = [
         10,
         timedelta,
         align=Alignment.RIGHT,
-        value_getter=lambda m, s: timedelta(seconds=m.timestamp - s["valid_from"])
-        if s["expire_at"] > m.timestamp
-        else timedelta(seconds=s["expire_at"] - s["valid_from"]),
+        batch_getter=get_session_durations,
         value_formatter=lambda m, s, x: pretty_time(x.total_seconds()),
+        depends=Dependency.TIME,
     ),
     Column("LEADPID", 7, int, field="pid"),
     Column("LEADPNAME", 15, str, field="proc_name"),
@@ -413,6 +502,7 @@ SESSION_COLUMNS = [
         bool,
         field="interactive",
         value_formatter=lambda m, s, x: "${2}Y" if x else "${1}N",
+        depends=Dependency.RECORD,
     ),
     Column("MUID", 20, str, field="muid", enabled=False),
     Column("SESSPATH", 0, str, field="spath"),
@@ -421,6 +511,19 @@ SESSION_COLUMNS = [
 
 ########################### Connections ###########################
 
+
+def get_connection_durations(model: AppModel, connections: List[Record]):
+    """Returns the time each connection has been open, or was open for
+    if it has closed"""
+    now = model.timestamp
+    return [
+        timedelta(seconds=now - conn["valid_from"])
+        if "duration" not in conn or "valid_to" not in conn or conn["valid_to"] > now
+        else timedelta(seconds=conn["duration"])
+        for conn in connections
+    ]
+
+
 CONNECTION_COLUMNS = [
     Column("ID", 42, str, enabled=False),
     Column("PTCL", 4, str, field="proto"),
@@ -430,10 +533,9 @@ CONNECTION_COLUMNS = [
         "DURATION",
         10,
         timedelta,
-        value_getter=lambda m, c: timedelta(seconds=m.timestamp - c["valid_from"])
-        if "duration" not in c or "valid_to" not in c or c["valid_to"] > m.timestamp
-        else timedelta(seconds=c["duration"]),
+        batch_getter=get_connection_durations,
         value_formatter=lambda m, c, x: pretty_time(x.total_seconds()),
+        depends=Dependency.TIME,
     ),
     Column("TXPACK", 6, int, field="packets_tx", enabled=False),
     Column("RXPACK", 6, int, field="packets_rx", enabled=False),
@@ -449,6 +551,7 @@ CONNECTION_COLUMNS = [
         else "EXTERNAL",
         value_formatter=lambda m, c, x: x if x != "EXTERNAL" else "${8,1}EXTERNAL",
         enabled=False,
+        depends=Dependency.RECORD,
     ),
     Column(
         "LOCAL",
@@ -457,6 +560,7 @@ CONNECTION_COLUMNS = [
         align=Alignment.RIGHT,
         value_getter=lambda m, c: f'{c["local_ip"]}:{c["local_port"]}',
         value_formatter=lambda m, c, x: pretty_address(c["local_ip"], c["local_port"]),
+        depends=Dependency.RECORD,
     ),
     Column(
         "DIR",
@@ -469,6 +573,7 @@ CONNECTION_COLUMNS = [
         else "${4}-->"
         if x == "outbound"
         else "${8,1}?",
+        depends=Dependency.RECORD,
     ),
     Column(
         "REMOTE",
@@ -478,6 +583,7 @@ CONNECTION_COLUMNS = [
         value_formatter=lambda m, c, x: pretty_address(
             c["remote_ip"], c["remote_port"]
         ),
+        depends=Dependency.RECORD,
     ),
 ]
 
@@ -509,8 +615,9 @@ FLAG_COLUMNS = [
         10,
         timedelta,
         align=Alignment.RIGHT,
-        value_getter=lambda m, f: timedelta(seconds=m.timestamp - f["time"]),
+        batch_getter=get_ages("time"),
         value_formatter=lambda m, f, x: pretty_time(x.total_seconds()),
+        depends=Dependency.TIME,
     ),
     Column(
         "EXCEPTED",
@@ -519,6 +626,7 @@ FLAG_COLUMNS = [
         align=Alignment.CENTER,
         field="false_positive",
         value_formatter=lambda m, f, x: "${2}Y" if x else "${1}N",
+        depends=Dependency.RECORD,
     ),
     Column(
         "SEV",
@@ -527,6 +635,7 @@ FLAG_COLUMNS = [
         align=Alignment.CENTER,
         value_getter=lambda m, f: Severity(SEVERITIES[f["severity"]]),
         value_formatter=color_severity,
+        depends=Dependency.RECORD,
     ),
     Column(
         "MITRE",
@@ -536,6 +645,7 @@ FLAG_COLUMNS = [
         if len(f["mitre_mapping"]) > 0
         else None,
         enabled=False,
+        depends=Dependency.RECORD,
     ),
     Column(
         "ANCESTORS",
@@ -544,12 +654,23 @@ FLAG_COLUMNS = [
         value_getter=lambda m, f: f.get("ancestors", None) or [],
         value_formatter=lambda m, f, x: "/".join(x),
         enabled=False,
+        depends=Dependency.RECORD,
     ),
     Column("Description", 0, str),
 ]
 
 ########################### Listening Sockets ###########################
 
+
+def get_listening_durations(model: AppModel, sockets: List[Record]):
+    """Returns the time each socket has been listening"""
+    now = model.timestamp
+    return [
+        timedelta(seconds=sock.get("duration", now - sock["valid_from"]))
+        for sock in sockets
+    ]
+
+
 LISTENING_SOCKET_COLUMNS = [
     Column("ID", 42, str, enabled=False),
     Column("FAMILY", 4, str),
@@ -559,10 +680,9 @@ LISTENING_SOCKET_COLUMNS = [
         "DURATION",
         10,
         timedelta,
-        value_getter=lambda m, l: timedelta(
-            seconds=l.get("duration", m.timestamp - l["valid_from"])
-        ),
+        batch_getter=get_listening_durations,
         value_formatter=lambda m, l, x: pretty_time(x.total_seconds()),
+        depends=Dependency.TIME,
     ),
     Column(
         "LOCAL",
@@ -571,6 +691,7 @@ LISTENING_SOCKET_COLUMNS = [
         align=Alignment.RIGHT,
         value_getter=lambda m, l: f'{l["local_ip"]}:{l["local_port"]}',
         value_formatter=lambda m, l, x: pretty_address(l["local_ip"], l["local_port"]),
+        depends=Dependency.RECORD,
     ),
     Column("PUID", 20, str, enabled=False),
     Column("PROCESS", 0, str, field="proc_name"),
@@ -614,6 +735,7 @@ CONTAINER_COLUMNS = [
         25,
         str,
         value_formatter=lambda m, c, x: x if x != "/pause" else "${8,1}/pause",
+        depends=Dependency.RECORD,
     ),
     Column(
         "CREATED",
@@ -621,6 +743,7 @@ CONTAINER_COLUMNS = [
         datetime,
         value_formatter=lambda m, c, x: pretty_time((m.time - x).total_seconds())
         + " ago",
+        depends=Dependency.TIME | Dependency.TIMEZONE,
     ),
     Column("START_TIME", 27, datetime, field="valid_from", enabled=False),
     Column(
@@ -634,6 +757,7 @@ CONTAINER_COLUMNS = [
             c.get("container_detail_state", {}).get("StartedAt"),
         ),
         value_formatter=lambda m, c, x: f"Up {pretty_time((m.time - x).total_seconds())}",
+        depends=Dependency.TIME | Dependency.TIMEZONE,
     ),
     Column(
         "PORTS",
@@ -641,6 +765,7 @@ CONTAINER_COLUMNS = [
         list,
         field="port_bindings",
         value_formatter=lambda m, c, x: ", ".join(x),
+        depends=Dependency.RECORD,
     ),
     Column(
         "VOLUMES",
@@ -649,6 +774,7 @@ CONTAINER_COLUMNS = [
         field="mounts",
         value_formatter=format_mounts,
         enabled=False,
+        depends=Dependency.RECORD,
     ),
     Column(
         "ENVIRONMENT",
@@ -657,9 +783,24 @@ CONTAINER_COLUMNS = [
         field="env",
         value_formatter=format_environ,
         enabled=False,
+        depends=Dependency.RECORD,
+    ),
+    Column(
+        "NETWORKS",
+        11,
+        dict,
+        value_formatter=format_networks,
+        enabled=False,
+        depends=Dependency.RECORD,
+    ),
+    Column(
+        "SYSTEM",
+        15,
+        str,
+        value_getter=get_system,
+        enabled=False,
+        depends=Dependency.RELATED,
     ),
-    Column("NETWORKS", 11, dict, value_formatter=format_networks, enabled=False),
-    Column("SYSTEM", 15, str, value_getter=get_system, enabled=False),
     Column(
         "ENTRYPOINT",
         15,
@@ -667,6 +808,7 @@ CONTAINER_COLUMNS = [
         value_getter=lambda m, c: " ".join(c.get("entrypoint") or []),
         value_formatter=lambda m, c, x: x if x != "/pause" else "${8,1}/pause",
         enabled=False,
+        depends=Dependency.RECORD,
     ),
     Column("NAME", 0, str, field="container_name"),
 ]
@@ -9,14 +9,28 @@
 The main app model for the application, containing all logic necessary
 to fetch and cache data from the Spyderbat API
 """
+# pylint: disable=too-many-lines
 
 import threading
 import json
-import gzip
-from math import nan
+import os
+from math import inf, isnan, nan
 from datetime import datetime, timedelta, timezone
-from typing import Callable, Dict, Optional, Set, List, Any, Tuple, Union
+from typing import (
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    Optional,
+    Set,
+    List,
+    Any,
+    Tuple,
+    Union,
+)
 import uuid
+from functools import partial
 
 import spyderbat_api
 from spyderbat_api.api import (
@@ -28,11 +42,47 @@ import urllib3
 from urllib3.exceptions import MaxRetryError
 
 from spydertop.config import Config
-from spydertop.utils import get_timezone, log
+from spydertop.utils import get_timezone, log, split_time_span
 from spydertop.utils.types import Record, Tree, TimeSpanTracker
 from spydertop.utils.cursorlist import CursorList
+from spydertop.utils.resources import ResourceTable
+from spydertop.utils.tree import ProcessTree
+from spydertop.utils.intervals import AliveDelta, AliveSet, IntervalIndex
+from spydertop.utils.cache import WindowCache
+from spydertop.utils.output import OutputWriter
+from spydertop.utils.sidecar import SidecarBuilder
+from spydertop.utils.stream import ConcurrentLines, LineStream, WindowedFile
+from spydertop.utils.decode import (
+    RECORD_SCHEMAS,
+    ChunkDecoder,
+    DecodedChunk,
+    RecordInterner,
+    valid_span,
+    is_newer,
+    record_key,
+)
 from spydertop.constants import API_LOG_TYPES
 
+# the types of data fetched from the API for each time window
+API_DATATYPES = ["spydergraph", "htop", "k8s"]
+# long time spans are fetched from the API as shards of at least this many
+# seconds, with no more than MAX_SHARDS shards per load
+SHARD_DURATION = 600
+MAX_SHARDS = 48
+# the maximum number of API requests in flight at once
+API_WORKERS = 6
+# during playback, the data after the loaded time span is fetched in the
+# background once the playhead is within PREFETCH_LEAD seconds of playback
+# time of the end of the span. At least PREFETCH_DURATION seconds are fetched
+PREFETCH_LEAD = 60
+PREFETCH_DURATION = 300
+# the number of lines sent to the output writer at a time
+OUTPUT_BATCH = 1000
+
+
+class ApiRequestError(Exception):
+    """Raised when a request for data from the API fails"""
+
 
 class AppModel:  # pylint: disable=too-many-instance-attributes,too-many-public-methods
     """
@@ -60,18 +110,36 @@ class AppModel:  # pylint: disable=too-many-instance-attributes,too-many-public-
     _time_span_tracker: TimeSpanTracker = TimeSpanTracker()
     _session_id: str
     _http_client: urllib3.PoolManager
-
-    _records: Dict[str, Dict[str, Record]] = {
-        "model_process": {},
-        "model_session": {},
-        "model_connection": {},
-        "model_machine": {},
-        "model_listening_socket": {},
-        "event_redflag": {},
-        "model_container": {},
-    }
-    _tree: Optional[Tree] = None
+    _streams: List[LineStream] = []
+    _parts_done: int = 0
+    _parts_total: int = 0
+    _decoder: ChunkDecoder
+    _window_cache: Optional[WindowCache] = None
+    _prefetch_thread: Optional[threading.Thread] = None
+    _prefetched: Optional[
+        Tuple[List[Tuple[float, float]], List[DecodedChunk], Dict[Any, Exception]]
+    ] = None
+    _last_prefetch_end: Optional[float] = None
+
+    _records: Dict[str, Dict[str, Record]] = {schema: {} for schema in RECORD_SCHEMAS}
+    # interval indexes of the records of each schema, built when needed,
+    # and the sets of records valid at the current time tracked using them
+    _intervals: Dict[str, IntervalIndex[Record]] = {}
+    _alive: Dict[str, AliveSet[Record]] = {}
+    _tree: Optional[ProcessTree] = None
+    # the processes which have been merged but not added to the tree
+    _new_processes: List[Record] = []
     _top_ids: Set[str] = set()
+    # the number of records merged, which only increases, so that
+    # views can tell when the loaded records changed
+    _merge_count: int = 0
+    # the process tables of the event_top_data records, by record id
+    _resources: Dict[str, ResourceTable] = {}
+    # the resource usage of single processes, by record id and PID, kept
+    # while the record is the most recent or previous event_top_data record
+    _resource_records: Dict[Tuple[str, int], Optional[Dict[str, Any]]] = {}
+    _resource_record_ids: Tuple[Optional[str], Optional[str]] = (None, None)
+    _resource_position: Optional[Tuple[Optional[float], int, int]] = None
     _tops: CursorList
     _machine: Optional[Record] = None
     _meminfo: Optional[Dict[str, int]] = None
@@ -81,6 +149,21 @@ class AppModel:  # pylint: disable=too-many-instance-attributes,too-many-public-
         self._timestamp = None
         self._session_id = uuid.uuid4().hex
         self._http_client = urllib3.PoolManager()
+        self._decoder = ChunkDecoder(config.decode_workers)
+        self._interner = RecordInterner()
+        self._intervals = {}
+        self._alive = {}
+        self._resources = {}
+        self._resource_records = {}
+        self._resource_record_ids = (None, None)
+        self._resource_position = None
+        self._new_processes = []
+        if config.cache_size > 0:
+            self._window_cache = WindowCache(
+                config.cache_dir, config.cache_size * 2**20
+            )
+            # the size limit may have been lowered since the last run
+            self._window_cache.evict()
 
         self._tops = CursorList("time", [], self._timestamp)
 
@@ -89,6 +172,7 @@ class AppModel:  # pylint: disable=too-many-instance-attributes,too-many-public-
             self.thread.join()
         if self.api_client:
             self.api_client.close()
+        self._decoder.close()
 
     def init(self) -> None:
         """Initialize the model, loading data from the source. Requires config to be complete"""
@@ -106,6 +190,13 @@ class AppModel:  # pylint: disable=too-many-instance-attributes,too-many-public-
             # should complete the configuration before the model is initialized
             raise Exception("Configuration is incomplete, cannot load data")
 
+        # records are written to the output file on a background thread,
+        # which must be set up before anything is written
+        if self.config.output is not None and not isinstance(
+            self.config.output, OutputWriter
+        ):
+            self.config.output = OutputWriter.open(self.config.output)
+
         def guard():
             try:
                 self.load_data(self._timestamp, self.config.start_duration)
@@ -117,10 +208,6 @@ class AppModel:  # pylint: disable=too-many-instance-attributes,too-many-public-
         thread.start()
         self.thread = thread
 
-        # if the output file is gzipped, open it with gzip
-        if self.config.output and self.config.output.name.endswith(".gz"):
-            self.config.output = gzip.open(self.config.output.name, "wt")
-
     def init_api(self) -> None:
         """Initialize the API client"""
         if isinstance(self.config.input, str):
@@ -135,8 +222,10 @@ class AppModel:  # pylint: disable=too-many-instance-attributes,too-many-public-
         api_instance: source_data_api.SourceDataApi,
         input_data: dict,
         datatype: str,
-    ) -> bytes:
-        """Load data from the API with a specified type"""
+    ) -> urllib3.HTTPResponse:
+        """Start loading data from the API with a specified type. The
+        response is returned unread, so that it can be streamed. If the
+        request fails, an ApiRequestError describing the failure is raised"""
         log.debug({"org_uid": self.config.org, "dt": datatype, **input_data})
         try:
             api_response: urllib3.HTTPResponse = api_instance.src_data_query_v2(
@@ -145,13 +234,11 @@ class AppModel:  # pylint: disable=too-many-instance-attributes,too-many-public-
                 **input_data,
                 _preload_content=False,
             )
-            newline = b"\n"
             log.debug(
                 f"Context-uid in response: {api_response.headers.get('x-context-uid', None)}, \
-status: {api_response.status}, size: {len(api_response.data.split(newline))}"
+status: {api_response.status}, size: {api_response.headers.get('content-length', None)}"
             )
         except spyderbat_api.ApiException as exc:
-            self.fail(f"Loading data from the api failed with reason: {exc.reason}")
             log.traceback(exc)
             log.debug(
                 f"""\
@@ -166,15 +253,16 @@ Body: {exc.body}
 Context-UID: {exc.headers.get("x-context-uid", None) if exc.headers else None}\
 """
             )
-            return b""
+            raise ApiRequestError(
+                f"The request failed with reason: {exc.reason}"
+            ) from exc
         except MaxRetryError as exc:
-            self.fail(
+            log.traceback(exc)
+            raise ApiRequestError(
                 f"There was an issue trying to connect to the API. \
 Is the url {self.config.input} correct?"
-            )
-            log.traceback(exc)
-            return b""
-        return api_response.data
+            ) from exc
+        return api_response
 
     def load_data(
         self,
@@ -182,16 +270,18 @@ Is the url {self.config.input} correct?"
         duration: Optional[timedelta] = None,
         before=timedelta(seconds=120),
     ) -> None:
-        """Load data from the source, either the API or a file, then process it"""
+        """Load data from the source, either the API, a capture, or a file, then process it"""
         self.loaded = False
         if duration is None:
             duration = self.config.start_duration
         log.info(f"Loading data for time: {timestamp} and duration: {duration}")
         self.loaded = False
         self.progress = 0.0
+        self._streams = []
+        self._parts_done = 0
+        self._parts_total = 0
 
         source = self.config.input
-        lines = []
 
         if isinstance(source, str):
             # url, load data from api
@@ -201,106 +291,402 @@ Is the url {self.config.input} correct?"
                 return
 
             api_instance = source_data_api.SourceDataApi(self.api_client)
-            input_data = {
-                # request data from a bit earlier, so that the information is properly filled out
-                "st": timestamp - before.total_seconds() + 30,
-                "et": timestamp + duration.total_seconds(),
-                "src": self.config.machine,
-            }
-
-            # we need more than one event_top record, so a buffer of 30 seconds is used
-            # to make sure the data is available
-            self._time_span_tracker.add_time_span(
-                input_data["st"] + 30, input_data["et"]
-            )
+            # request data from a bit earlier, so that the information is properly filled out
+            start = timestamp - before.total_seconds() + 30
+            end = timestamp + duration.total_seconds()
 
-            lines += self.load_from_api(api_instance, input_data, "spydergraph").split(
-                b"\n"
+            self._process_records(
+                self._stream_from_api(api_instance, timestamp, start, end)
             )
-            lines += self.load_from_api(api_instance, input_data, "htop").split(b"\n")
-            lines += self.load_from_api(api_instance, input_data, "k8s").split(b"\n")
+        elif isinstance(source, WindowedFile):
+            # capture or indexed file, read in the records around the requested time
+            self._load_from_windowed_file(source, timestamp, duration, before)
         else:
             # file, read in records and parse
             log.info(f"Reading records from input file: {source.name}")
 
-            lines = source.readlines()
-            if len(lines) == 0:
-                # file was most likely already read
+            stream = LineStream.from_file(source)
+            if stream.exhausted:
+                # file was already read
                 self.fail(
                     "The current time is unloaded, but input is from a file. \
 No more records can be loaded."
                 )
                 return
-            self.log_api(
-                API_LOG_TYPES["loaded_data"], {"source_id": "file", "count": len(lines)}
-            )
+            self._streams.append(stream)
 
-        if self.config.output:
-            # if lines is still binary, convert to text
-            if len(lines) > 0 and isinstance(lines[0], bytes):
-                lines = [line.decode("utf-8") for line in lines]  # type: ignore
-            self.config.output.write("\n".join([l.rstrip() for l in lines]))
+            # index the file while it is read, so that next time
+            # it can be opened without reading it in full
+            lines: Iterable[bytes] = stream
+            path = getattr(source, "name", None)
+            if isinstance(path, str) and os.path.isfile(path):
+                lines = SidecarBuilder(path).observe(stream)
 
-        self._process_records(lines)
+            count = self._process_records(lines)
+            self.log_api(
+                API_LOG_TYPES["loaded_data"], {"source_id": "file", "count": count}
+            )
 
-    def _process_records(self, lines: List[str]) -> None:
-        """Process the loaded records, parsing them and adding them to the model"""
-        log.info("Parsing records")
-        self.progress = 0.0
+    def _load_from_windowed_file(
+        self,
+        source: WindowedFile,
+        timestamp: Optional[float],
+        duration: timedelta,
+        before: timedelta,
+    ) -> None:
+        """Load the records for a time span from a capture or indexed
+        file, reading only the records which are valid during it"""
+        first_top = source.start_time("event_top")
+        if first_top is None:
+            self.fail(f"The input file {source.name} contains no records.")
+            return
+        if timestamp is None:
+            # start from the beginning of the capture
+            start = first_top
+        else:
+            start = timestamp - before.total_seconds() + 30
+        end = (timestamp or start) + duration.total_seconds()
+        log.info(f"Reading records from {source.name} from {start} to {end}")
+
+        stream = source.stream(start, end)
+        self._streams.append(stream)
+        # there are no records before the start of the file, so
+        # no buffer is needed to fill out the information there
+        buffer = 30 if start > first_top else 0
+        self._time_span_tracker.add_time_span(start + buffer, end)
+
+        count = self._process_records(stream)
+        self.log_api(
+            API_LOG_TYPES["loaded_data"], {"source_id": "file", "count": count}
+        )
 
-        if not lines or len(lines) == 0 or lines[0] == "" or lines[0] == b"":
+    def _stream_from_api(
+        self,
+        api_instance: source_data_api.SourceDataApi,
+        timestamp: float,
+        start: float,
+        end: float,
+    ) -> Iterator[bytes]:
+        """Fetch every datatype from the API for a time span, yielding lines
+        from each response as they arrive. Long time spans are split into
+        shards, which are fetched in parallel"""
+        shards = split_time_span(start, end, SHARD_DURATION, MAX_SHARDS)
+
+        def on_complete(_key) -> None:
+            self._parts_done += 1
+
+        lines = self._open_api_lines(api_instance, shards, self._streams, on_complete)
+        self._parts_done = 0
+        self._parts_total = len(shards) * len(API_DATATYPES)
+        yield from lines
+
+        self._mark_loaded_shards(shards, {shard for _, shard in lines.failures})
+        self._log_api_failures(shards, lines.failures)
+
+        # failed shards are loaded again if they are needed, so failures
+        # are only fatal if the requested time could not be loaded
+        if len(lines.failures) > 0 and not self._time_span_tracker.is_loaded(timestamp):
             self.fail(
-                "Loading was successful, but no records were found. \
-Are you asking for the wrong time?"
+                "Loading data from the api failed:\n"
+                + "\n".join(
+                    {
+                        f"{datatype}: {exc}"
+                        for (datatype, _), exc in lines.failures.items()
+                    }
+                )
             )
-            return
 
-        event_tops = []
+    def _open_api_lines(
+        self,
+        api_instance: source_data_api.SourceDataApi,
+        shards: List[Tuple[float, float]],
+        streams: List[LineStream],
+        on_complete: Optional[Callable[[Any], None]] = None,
+    ) -> ConcurrentLines:
+        """Create a reader for every datatype in each shard. Each stream
+        is added to streams once its request succeeds"""
+
+        def open_stream(datatype: str, shard: int) -> LineStream:
+            if self._window_cache is None:
+                stream = self._fetch_window(api_instance, datatype, *shards[shard])
+            else:
+                stream = self._open_cached_window(
+                    api_instance, datatype, *shards[shard]
+                )
+            streams.append(stream)
+            return stream
+
+        # shards are requested in order, so the earliest data arrives first
+        return ConcurrentLines(
+            {
+                (datatype, shard): partial(open_stream, datatype, shard)
+                for shard in range(len(shards))
+                for datatype in API_DATATYPES
+            },
+            API_WORKERS,
+            on_complete,
+        )
 
-        for i, line in enumerate(lines):
-            self.progress = i / len(lines)
+    def _fetch_window(
+        self,
+        api_instance: source_data_api.SourceDataApi,
+        datatype: str,
+        start: float,
+        end: float,
+    ) -> LineStream:
+        """Request a time window of a datatype from the API"""
+        input_data = {"st": start, "et": end, "src": self.config.machine}
+        return LineStream.from_response(
+            self.load_from_api(api_instance, input_data, datatype)
+        )
 
-            # suppress errors for empty lines
-            if line.strip() == "":
+    def _open_cached_window(
+        self,
+        api_instance: source_data_api.SourceDataApi,
+        datatype: str,
+        start: float,
+        end: float,
+    ) -> LineStream:
+        """Read a time window of a datatype from the cache, fetching only
+        the parts which are not cached from the API"""
+        assert self._window_cache is not None
+        key = (self.config.org or "", self.config.machine or "", datatype)
+        paths, gaps = self._window_cache.lookup(*key, start, end)
+        log.info(
+            f"Reading {len(paths)} cached windows for {datatype} data from \
+{start} to {end}, fetching {len(gaps)} uncached windows"
+        )
+
+        parts = []
+        for path in paths:
+            part = self._window_cache.read(path)
+            if part is not None:
+                parts.append(part)
                 continue
+            # the entry was evicted by another instance, so it is fetched
+            span = self._window_cache.entry_span(path)
+            assert span is not None
+            gaps.append((max(span[0], start), min(span[1], end)))
+        for gap_start, gap_end in gaps:
+            stream = self._fetch_window(api_instance, datatype, gap_start, gap_end)
+            if self._window_cache.is_cacheable(gap_end):
+                stream = self._window_cache.store(
+                    *key, gap_start, gap_end, stream=stream
+                )
+            parts.append(stream)
+        return parts[0] if len(parts) == 1 else LineStream.concat(parts)
 
-            try:
-                record = json.loads(line)
-            except json.JSONDecodeError as exc:
-                log.err(f"Error decoding record: {line}")
-                log.traceback(exc)
+    @staticmethod
+    def _log_api_failures(
+        shards: List[Tuple[float, float]], failures: Dict[Any, Exception]
+    ) -> None:
+        """Log the requests which failed while reading shards from the API"""
+        for (datatype, shard), exc in failures.items():
+            log.err(
+                f"Loading {datatype} data from the api failed for \
+{shards[shard][0]} to {shards[shard][1]}: {exc}"
+            )
+            log.traceback(exc)
+
+    def _mark_loaded_shards(
+        self, shards: List[Tuple[float, float]], failed_shards: Set[int]
+    ) -> None:
+        """Mark the shards which loaded completely in the time span tracker"""
+        for shard, (shard_start, shard_end) in enumerate(shards):
+            if shard in failed_shards:
                 continue
+            # we need more than one event_top record, so a buffer of 30 seconds
+            # is left at the start of each span to make sure the data is available
+            buffer = 30 if shard == 0 or shard - 1 in failed_shards else 0
+            self._time_span_tracker.add_time_span(shard_start + buffer, shard_end)
+
+    def _write_output(
+        self, lines: Iterable[Union[str, bytes]]
+    ) -> Iterator[Union[str, bytes]]:
+        """Pass through lines, sending them to the output writer in batches"""
+        output = self.config.output
+        if not isinstance(output, OutputWriter):
+            yield from lines
+            return
+        batch: List[Union[str, bytes]] = []
+        for line in lines:
+            batch.append(line)
+            if len(batch) >= OUTPUT_BATCH:
+                output.write_lines(batch)
+                batch = []
+            yield line
+        if batch:
+            output.write_lines(batch)
+
+    def _process_records(self, lines: Iterable[Union[str, bytes]]) -> int:
+        """Process the loaded records as they arrive, parsing them and adding
+        them to the model. Returns the number of records processed"""
+        log.info("Parsing records")
+        self.progress = 0.0
 
-            if record["schema"].startswith("event_top"):
-                if record["id"] in self._top_ids:
-                    continue
-                self._top_ids.add(record["id"])
-                event_tops.append(record)
-            if record["schema"].startswith("model_container"):
-                self._records["model_container"][record["container_id"]] = record
-            else:
-                short_schema = record["schema"].split(":")[0]
+        event_tops = []
+        count = 0
 
-                if short_schema not in self._records:
-                    continue
+        for chunk in self._decoder.decode(
+            self._write_output(lines), frozenset(self._top_ids)
+        ):
+            self._merge_chunk(chunk, event_tops)
+            count += chunk.count
+            self._update_progress()
 
-                # only save the most recent version of each record
-                if record["id"] not in self._records[short_schema]:
-                    self._records[short_schema][record["id"]] = record
-                else:
-                    if (
-                        record["time"]
-                        > self._records[short_schema][record["id"]]["time"]
-                    ):
-                        self._records[short_schema][record["id"]] = record
+        self._update_progress()
+
+        if count == 0:
+            if self.failed:
+                # the reason for the failure has already been reported
+                return 0
+            self.fail(
+                "Loading was successful, but no records were found. \
+Are you asking for the wrong time?"
+            )
+            return 0
 
         self._tops.extend(event_tops)
 
-        self.rebuild_tree()
+        self._update_tree()
 
-        log.info("Finished parsing records")
+        log.info(f"Finished parsing {count} records")
         self.loaded = True
-        self._fix_state()
+        # a failed load would otherwise immediately be retried,
+        # as the failed time is not marked as loaded
+        if not self.failed:
+            self._fix_state()
+        return count
+
+    def _merge_chunk(self, chunk: DecodedChunk, event_tops: List[Record]) -> None:
+        """Merge a decoded chunk into the model, adding any
+        event_top records which are new to event_tops"""
+        for error in chunk.errors:
+            log.err(error)
+        self._merge_records(chunk.records)
+        for record in chunk.tops:
+            if record["id"] in self._top_ids:
+                continue
+            self._top_ids.add(record["id"])
+            # the process table is stored by column instead of in the record
+            self._resources[record["id"]] = ResourceTable(
+                record.pop("processes", None) or {}
+            )
+            event_tops.append(self._interner.intern_record(record))
+
+    def _merge_records(self, records: List[Tuple[str, Record]]) -> None:
+        """Merge decoded records into the model, keeping only the
+        most recent version of each record"""
+        for short_schema, record in records:
+            stored = self._records[short_schema]
+            key = record_key(short_schema, record)
+            existing = stored.get(key)
+            if existing is None or is_newer(short_schema, record, existing):
+                stored[key] = self._interner.intern_record(record)
+                self._merge_count += 1
+                if short_schema == "model_process":
+                    self._new_processes.append(stored[key])
+                self._intervals.pop(short_schema, None)
+                self._alive.pop(short_schema, None)
+
+    def prefetch(self, timestamp: float, speed: float) -> None:
+        """Start fetching the data following the loaded time span containing
+        timestamp in the background, if playback at the given speed will reach
+        the end of the span soon. The data is added by merge_prefetched"""
+        if (
+            not self.windowed_input
+            or not self.loaded
+            or self.failed
+            or self.prefetching
+        ):
+            return
+        end = self._time_span_tracker.span_end(timestamp)
+        speed = max(speed, 1)
+        # a window which failed to load is not retried until playback
+        # reaches it, at which point it is loaded normally
+        if (
+            end is None
+            or end == self._last_prefetch_end
+            or end - timestamp > PREFETCH_LEAD * speed
+        ):
+            return
+
+        # fetch enough to keep playing for a while at the current speed,
+        # starting early so that the event_top records overlap
+        duration = max(PREFETCH_DURATION, PREFETCH_LEAD * speed * 2)
+        log.info(f"Prefetching data for {end} to {end + duration}")
+        shards = split_time_span(end - 30, end + duration, SHARD_DURATION, MAX_SHARDS)
+        self._last_prefetch_end = end
+        self._prefetch_thread = threading.Thread(
+            target=self._run_prefetch,
+            args=(shards, frozenset(self._top_ids)),
+            daemon=True,
+        )
+        self._prefetch_thread.start()
+
+    def _run_prefetch(
+        self, shards: List[Tuple[float, float]], known_top_ids: FrozenSet[str]
+    ) -> None:
+        """Fetch and decode shards in the background, leaving the
+        results to be merged into the model by merge_prefetched"""
+        chunks: List[DecodedChunk] = []
+        source = self.config.input
+        failures: Dict[Any, Exception] = {}
+        try:
+            if isinstance(source, WindowedFile):
+                stream = source.stream(shards[0][0], shards[-1][1])
+                chunks = list(
+                    self._decoder.decode(self._write_output(stream), known_top_ids)
+                )
+            else:
+                api_instance = source_data_api.SourceDataApi(self.api_client)
+                lines = self._open_api_lines(api_instance, shards, [])
+                chunks = list(
+                    self._decoder.decode(self._write_output(lines), known_top_ids)
+                )
+                failures = lines.failures
+        except Exception as exc:  # pylint: disable=broad-except
+            failures = {
+                (datatype, shard): exc
+                for shard in range(len(shards))
+                for datatype in API_DATATYPES
+            }
+
+        # the model may have been cleared while this was running
+        if self._prefetch_thread is threading.current_thread():
+            self._prefetched = (shards, chunks, failures)
+
+    def merge_prefetched(self) -> bool:
+        """Merge data fetched in the background into the model, returning
+        whether anything was merged. This must be called from the thread
+        which reads the model, as records are updated in place"""
+        prefetched = self._prefetched
+        if prefetched is None or not self.loaded:
+            return False
+        shards, chunks, failures = prefetched
+        self._prefetched = None
+        self._prefetch_thread = None
+
+        event_tops: List[Record] = []
+        for chunk in chunks:
+            self._merge_chunk(chunk, event_tops)
+        self._mark_loaded_shards(shards, {shard for _, shard in failures})
+        self._log_api_failures(shards, failures)
+
+        if len(event_tops) > 0:
+            self._tops.extend(event_tops)
+            self._update_tree()
+        log.info(f"Merged {len(event_tops)} prefetched event_top records")
+        return True
+
+    def _update_progress(self) -> None:
+        """Update the loading progress from the bytes consumed by the input streams,
+        or from the number of streams completed if their sizes are not known"""
+        total = self.bytes_total
+        if total:
+            self.progress = min(self.bytes_loaded / total, 1.0)
+        elif self._parts_total > 0:
+            self.progress = self._parts_done / self._parts_total
 
     def _correct_meminfo(self) -> None:
         """Correct the memory information for the current time"""
@@ -329,30 +715,13 @@ Are you asking for the wrong time?"
                 self.recover("reload")
                 return
 
-            if not self._time_span_tracker.is_loaded(self._timestamp) and isinstance(
-                self.config.input, str
+            if (
+                not self._time_span_tracker.is_loaded(self._timestamp)
+                and self.windowed_input
             ):
-                # this is currently disabled due to errors
-                #
-                # # load data for a time farther away from the loaded
-                # # time if self._timestamp is close
-                # # this is to avoid loading data that is not needed
-                # if len(self._tops.data) == 0:
-                #     closest_time = self._timestamp
-                #     offset = 0
-                # # make sure to leave a buffer of 2 event_tops
-                # elif not self._tops.is_valid(-2):
-                #     closest_time = self._tops.data[2]["time"]
-                #     offset = -298
-                # else:
-                #     closest_time = self._tops[0]["time"]
-                #     offset = +298
-
-                # time_to_load = (
-                #     self._timestamp
-                #     if abs(self._timestamp - closest_time) > 300
-                #     else closest_time + offset
-                # )
+                # data ahead of the playhead is fetched during playback
+                # by prefetch, so this is only reached when jumping to
+                # an unloaded time
                 time_to_load = self._timestamp
 
                 thread = threading.Thread(
@@ -395,21 +764,6 @@ not enough information could be loaded.\
 """
             )
 
-    @staticmethod
-    def _make_branch(
-        rec_id: str, processes_w_children: Dict[str, List], enabled: bool
-    ) -> Optional[Tuple[bool, Tree]]:
-        """Recursively create a tree branch for a process"""
-        # branches are tuples of (enabled, {child id: branch})
-        if processes_w_children[rec_id] == []:
-            return None
-        branch = (enabled, {})
-        for child in processes_w_children[rec_id]:
-            branch[1][child] = AppModel._make_branch(
-                child, processes_w_children, enabled
-            )
-        return branch  # type: ignore
-
     def get_orgs(self) -> Optional[List[org_api.Org]]:
         """Fetch a list of organization for this api_key"""
         api_instance: org_api.OrgApi = org_api.OrgApi(self.api_client)
@@ -532,60 +886,109 @@ Is the url {self.config.input} correct?"
             return None
         return self._tops[index][key]
 
-    def get_top_processes(
-        self,
-    ) -> Tuple[
-        Optional[Dict[str, Union[str, int]]], Optional[Dict[str, Union[str, int]]]
-    ]:
-        """Get the resource usage records for the processes at the current time"""
-        if not self.tops_valid():
-            return None, None
-        return (self._tops[-1]["processes"], self._tops[0]["processes"])
-
-    def rebuild_tree(self) -> None:
-        """Create a tree structure for the processes, based on the puid and ppuid"""
-        processes_w_children = {}
-        processes = self.processes
+    def resource_table(self, previous=False) -> Optional[ResourceTable]:
+        """Provides the resource usage of the processes in the most recent
+        or the previous event_top_data record"""
+        top_id = self.get_value("id", previous)
+        if top_id is None:
+            return None
+        return self._resources.get(top_id)
 
-        # the two main root processes are the kernel and the init process
-        # we will use these as the root of the tree
-        kthreadd = None
-        init = None
+    def resource_record(self, pid: int, previous=False) -> Optional[Dict[str, Any]]:
+        """
+        Provides the resource usage of a process in the most recent or the
+        previous event_top_data record, as returned by ResourceTable.record.
+        Records are built the first time they are asked for, and dropped
+        once their event_top_data record is neither the most recent nor
+        the previous one.
+        """
+        # the records in use only change when the time moves or
+        # event_top_data records are added
+        position = (self._timestamp, self._tops.index, len(self._tops.data))
+        if position != self._resource_position:
+            self._resource_position = position
+            top_ids = (self.get_value("id"), self.get_value("id", previous=True))
+            if top_ids != self._resource_record_ids:
+                self._resource_records = {
+                    key: record
+                    for key, record in self._resource_records.items()
+                    if key[0] in top_ids
+                }
+                self._resource_record_ids = top_ids
+
+        top_id = self._resource_record_ids[1 if previous else 0]
+        if top_id is None:
+            return None
+        key = (top_id, pid)
+        if key in self._resource_records:
+            return self._resource_records[key]
+
+        table = self._resources.get(top_id)
+        record = table.record(pid) if table is not None else None
+        self._resource_records[key] = record
+        return record
+
+    def records_at(
+        self, short_schema: str, timestamp: float, lookback: float = 0.0
+    ) -> List[Record]:
+        """
+        Find the records of a schema which are valid at the timestamp, or
+        which stopped being valid less than lookback seconds before it. Events
+        are valid from the time they occur onwards. Records are returned in
+        the order they were loaded.
+        """
+        start = timestamp - lookback if not isnan(lookback) else -inf
+        return self._interval_index(short_schema).overlapping(start, timestamp)
 
-        for proc in processes.values():
-            try:
-                if proc["id"] not in processes_w_children:
-                    processes_w_children[proc["id"]] = []
-                if (
-                    proc["ppuid"] is not None
-                    and proc["ppuid"] not in processes_w_children
-                ):
-                    processes_w_children[proc["ppuid"]] = []
-                if proc["ppuid"] is not None:
-                    processes_w_children[proc["ppuid"]].append(proc["id"])
-                if proc["pid"] == 1:
-                    init = str(proc["id"])
-                if proc["pid"] == 2:
-                    kthreadd = str(proc["id"])
-            except KeyError as exc:
-                log.err(f"Process {exc} is missing.")
-                log.traceback(exc)
-                continue
+    def alive_delta(
+        self, short_schema: str, timestamp: float, lookback: float = 0.0, reset=False
+    ) -> AliveDelta:
+        """
+        Find the changes to the records of a schema which are valid at the
+        timestamp, as defined by records_at, since the previous call for the
+        schema. Only the records which start or stop being valid in between
+        are visited. The set is rebuilt when new records are merged, or when
+        reset is True, in which case the delta holds every valid record.
+        """
+        tracker = self._alive.get(short_schema)
+        if tracker is None or reset:
+            tracker = AliveSet(self._interval_index(short_schema))
+            self._alive[short_schema] = tracker
+        start = timestamp - lookback if not isnan(lookback) else -inf
+        return tracker.move(start, timestamp)
+
+    def _interval_index(self, short_schema: str) -> IntervalIndex[Record]:
+        """The interval index of the records of a schema, which is
+        built the first time it is needed after records are merged"""
+        index = self._intervals.get(short_schema)
+        if index is None:
+            index = IntervalIndex(
+                valid_span(record) for record in self._records[short_schema].values()
+            )
+            self._intervals[short_schema] = index
+        return index
 
-        self._tree = {}  # type: ignore
+    def rebuild_tree(self) -> None:
+        """Create a tree structure for the processes, based on the puid and
+        ppuid, with every branch expanded or collapsed by the settings"""
+        self._tree = ProcessTree(not self.config["collapse_tree"])
+        self._tree.add(self.processes.values())
+        self._new_processes = []
+
+    def _update_tree(self) -> None:
+        """Add the processes loaded since the last update to the tree,
+        keeping the expanded state of the existing branches"""
+        if self._tree is None:
+            self._tree = ProcessTree(not self.config["collapse_tree"])
+        self._tree.add(self._new_processes)
+        self._new_processes = []
 
-        # add the root processes to the tree
-        if kthreadd:
-            self._tree[kthreadd] = AppModel._make_branch(
-                kthreadd, processes_w_children, not self.config["collapse_tree"]
-            )
-            # root processes are always enabled
-            self._tree[kthreadd] = (True, self._tree[kthreadd][1])
-        if init:
-            self._tree[init] = AppModel._make_branch(
-                init, processes_w_children, not self.config["collapse_tree"]
-            )
-            self._tree[init] = (True, self._tree[init][1])
+    def toggle_branch(self, rec_id: str) -> Optional[Tuple[bool, Tree]]:
+        """Expand or collapse the branch of the tree under a process,
+        returning the new branch, or None if the process has no children"""
+        if self._tree is None:
+            return None
+        return self._tree.toggle(rec_id)
 
     def recover(self, method="revert") -> None:
         """Recover the state of the model, using the given method.
@@ -686,7 +1089,7 @@ Is the url {self.config.input} correct?"
             and self._timestamp is not None
             and (
                 self._time_span_tracker.is_loaded(self._timestamp)
-                or not isinstance(self.config.input, str)
+                or not self.windowed_input
             )
         )
 
@@ -697,18 +1100,18 @@ Is the url {self.config.input} correct?"
         self._last_good_timestamp = None
         self._time_span_tracker = TimeSpanTracker()
 
-        self._records = {
-            "model_process": {},
-            "model_session": {},
-            "model_connection": {},
-            "model_machine": {},
-            "model_listening_socket": {},
-            "event_redflag": {},
-            "model_container": {},
-        }
+        self._records = {schema: {} for schema in RECORD_SCHEMAS}
+        self._intervals = {}
+        self._alive = {}
         self._tree = None
+        self._new_processes = []
         self._top_ids = set()
+        self._resources = {}
+        self._resource_records = {}
+        self._resource_record_ids = (None, None)
+        self._resource_position = None
         self._tops = CursorList("time", [], self._timestamp)
+        self._interner = RecordInterner()
         self._machine = None
         self._meminfo = None
 
@@ -716,13 +1119,21 @@ Is the url {self.config.input} correct?"
         self.failed = False
         self.failure_reason = ""
         self.progress = 0
+        self._streams = []
+        self._prefetch_thread = None
+        self._prefetched = None
+        self._last_prefetch_end = None
         self.columns_changed = False
 
     def is_loaded(self, timestamp: float) -> bool:
         """Return whether the model has loaded data for the given time"""
-        return self._time_span_tracker.is_loaded(timestamp) or not isinstance(
-            self.config.input, str
-        )
+        return self._time_span_tracker.is_loaded(timestamp) or not self.windowed_input
+
+    @property
+    def windowed_input(self) -> bool:
+        """Whether data is loaded from the input one time span at a time,
+        rather than reading the whole input at once"""
+        return isinstance(self.config.input, (str, WindowedFile))
 
     @property
     def state(self) -> str:
@@ -734,6 +1145,26 @@ Is the url {self.config.input} correct?"
                 pass
         return f"Time: {self.time}"
 
+    @property
+    def prefetching(self) -> bool:
+        """Whether data is being fetched in the background,
+        or is waiting to be merged into the model"""
+        return self._prefetch_thread is not None
+
+    @property
+    def bytes_loaded(self) -> int:
+        """The number of bytes consumed from the input for the current load"""
+        return sum(stream.consumed for stream in self._streams)
+
+    @property
+    def bytes_total(self) -> Optional[int]:
+        """The number of bytes expected from the input for the current load,
+        or None if it is not yet known"""
+        totals = [stream.total for stream in self._streams]
+        if len(totals) == 0 or None in totals:
+            return None
+        return sum(totals)  # type: ignore
+
     @property
     def time_elapsed(self) -> float:
         """The time elapsed between the last event_top_data record and the current one"""
@@ -753,6 +1184,12 @@ Is the url {self.config.input} correct?"
         """The most recent machine data"""
         return self._machine
 
+    @property
+    def merge_count(self) -> int:
+        """The number of records merged so far, which changes
+        whenever a loaded record is added or replaced"""
+        return self._merge_count
+
     @property
     def processes(self) -> Dict[str, Record]:
         """All currently loaded process records"""
@@ -796,7 +1233,7 @@ Is the url {self.config.input} correct?"
         """
         if self._tree is None:
             raise Exception("The tree is not yet loaded.")
-        return self._tree
+        return self._tree.root
 
     # time properties
     @property
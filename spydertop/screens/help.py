@@ -124,6 +124,7 @@ ${{{label},1}}        l:${{{background}}} switch to listening tab\
 ${{{label},1}}  F1 h ?:${{{background}}} show this help screen
 ${{{label},1}}  F2 C S:${{{background}}} show setup screen
 ${{{label},1}}    F3 /:${{{background}}} search (in all columns)
+${{{label},1}}   Up/Dn:${{{background}}} previous/next search match
 ${{{label},1}}    F4 \\:${{{background}}} filter (by all columns)
 ${{{label},1}}    F5 t:${{{background}}} toggle tree view
 ${{{label},1}}  F6 > .:${{{background}}} select a column to sort by
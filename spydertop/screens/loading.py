@@ -17,6 +17,7 @@ from asciimatics.event import KeyboardEvent
 from spydertop.model import AppModel
 
 from spydertop.constants import COLOR_REGEX
+from spydertop.utils import header_bytes
 from spydertop.utils.types import ExtendedParser
 from spydertop.widgets import FuncLabel
 
@@ -95,6 +96,7 @@ class LoadingFrame(Frame):
                 + ("|" * bars)
                 + (" " * (max_bars - bars))
                 + f"${{8}}]${{-1}} {round(self._model.progress*100,1):>5}%"
+                + f" ${{8}}({header_bytes(self._model.bytes_loaded)}B)"
             )
 
         self._label = FuncLabel(update_bar, align="^", parser=ExtendedParser())
@@ -9,10 +9,10 @@
 The main frame for the tool. This frame contains the record list and usage metrics,
 as well as showing all the menu buttons.
 """
+# pylint: disable=too-many-lines
 
 from math import nan
-import re
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 import urllib.parse
 import webbrowser
 
@@ -42,9 +42,10 @@ from spydertop.screens.meters import (
 )
 from spydertop.screens.modals import InputModal, NotificationModal
 from spydertop.widgets import Table
+from spydertop.widgets.table import CellCache, LazyRow
 from spydertop.utils import log, convert_to_seconds, pretty_time, calculate_widths
-from spydertop.utils.types import ExtendedParser
-from spydertop.constants import API_LOG_TYPES
+from spydertop.utils.types import Dependency, ExtendedParser, Record
+from spydertop.constants import API_LOG_TYPES, TAB_SCHEMAS
 from spydertop.constants.columns import (
     CONTAINER_COLUMNS,
     PROCESS_COLUMNS,
@@ -75,6 +76,16 @@ class MainFrame(Frame):  # pylint: disable=too-many-instance-attributes
     _cached_displayable: List = []
     _current_columns: List[Column] = PROCESS_COLUMNS
     _old_column_val = None
+    # the records valid at the current time, by their object id,
+    # and the tab they belong to
+    _alive: Dict[int, Record] = {}
+    _alive_tab: Optional[str] = None
+    # the rows of the visible records by their object id, what the rows
+    # were built for, and what their cells were last calculated for
+    _rows: Dict[int, LazyRow] = {}
+    _rows_for: Optional[Tuple] = None
+    _row_inputs: Dict[Dependency, Any] = {}
+    _cell_cache: CellCache
     _last_effects: int = 1
 
     # widgets
@@ -99,6 +110,8 @@ class MainFrame(Frame):  # pylint: disable=too-many-instance-attributes
         )
         self._model = model
         self._old_settings = model.config.settings
+        self._rows = {}
+        self._row_inputs = {}
 
         self.set_theme(model.config["theme"])
 
@@ -249,13 +262,21 @@ class MainFrame(Frame):  # pylint: disable=too-many-instance-attributes
         if not self._widgets_initialized:
             self._init_widgets()
 
+        # add any data which was fetched in the background
+        if self._model.merge_prefetched():
+            self.needs_recalculate = True
+
         # update model (if needed, at most 4 times per second)
         if conf["play"] and (frame_no % max(int(20 / conf["play_speed"]), 5) == 0):
             if self._last_frame != 0:
                 frames_delta = frame_no - self._last_frame
                 time_delta = frames_delta / 20
                 new_time = self._model.timestamp + time_delta * conf["play_speed"]
-                if not self._model.is_loaded(new_time):
+                self._model.prefetch(self._model.timestamp, conf["play_speed"])
+                if self._model.is_loaded(new_time):
+                    self._model.timestamp = new_time
+                    self.needs_recalculate = True
+                elif not self._model.prefetching:
                     # stop playing and notify user
                     conf["play"] = False
                     self.scene.add_effect(
@@ -267,15 +288,22 @@ class MainFrame(Frame):  # pylint: disable=too-many-instance-attributes
                             frames=40,
                         )
                     )
-                else:
-                    self._model.timestamp = new_time
-                    self.needs_recalculate = True
+                # otherwise, playback pauses until the data ahead arrives
             self._last_frame = frame_no
 
         # detect changes in settings
         if conf.settings_changed:
             conf.settings_changed = False
-            self.needs_update = True
+            changed = {
+                key
+                for key, value in conf.settings.items()
+                if self._old_settings.get(key) != value
+            }
+            if changed == {"filter"}:
+                # the rows have not changed, so they are only filtered again
+                self._columns.do_filter()
+            else:
+                self.needs_update = True
             if conf["theme"] != self._old_settings["theme"]:
                 self.set_theme(conf["theme"])
                 # update theme colors in tabs
@@ -325,9 +353,10 @@ class MainFrame(Frame):  # pylint: disable=too-many-instance-attributes
             # work up the caching system, updating each part of the cache
             # only if necessary
             if self.needs_recalculate:
-                self._build_options(getattr(self._model, self._model.config["tab"]))
+                # the table is only updated if any of its rows changed
+                if self._build_options(self._model.config["tab"]):
+                    self.needs_update = True
                 self.needs_recalculate = False
-                self.needs_update = True
 
             if self.needs_update:
                 self._update_columns()
@@ -425,50 +454,125 @@ class MainFrame(Frame):  # pylint: disable=too-many-instance-attributes
         self._columns.columns = self._current_columns
         self._columns.set_rows(self._cached_displayable, self._cached_sortable)
 
-    def _build_options(self, records: Dict[str, Any]):
-        """Builds options for records other than the processes tab, using
-        the current columns"""
-        self._cached_displayable = []
-        self._cached_sortable = []
-
+    def _build_options(self, tab: str) -> bool:
+        """Builds options for the records of the given tab which are visible
+        at the current time, using the current columns. Only the rows of
+        records which became visible are built, and only the cells which
+        depend on something that changed are recalculated. Returns whether
+        any rows changed."""
         if self._model.timestamp is None:
+            self._cached_displayable = []
+            self._cached_sortable = []
+            self._rows_for = None
             self._model.recover()
             self.needs_recalculate = True
-            return
-
-        for record in records.values():
-            # determine if the record is visible for this time
-            if "valid_from" in record:
-                if record["valid_from"] > self._model.timestamp or (
-                    "valid_to" in record
-                    and record["valid_to"]
-                    < self._model.timestamp - self._model.time_elapsed
-                ):
-                    continue
-            elif "time" in record:
-                # show all events only after they occur
-                if self._model.timestamp < record["time"]:
-                    continue
-
-            # ignore if the record is a process and it is hidden
-            if self._model.config["tab"] == "processes" and (
-                self._model.config["hide_kthreads"]
-                and record["type"] == "kernel thread"
-                or self._model.config["hide_threads"]
-                and record["type"] == "thread"
-            ):
-                continue
-
-            # build the row for options
-            cells = []
-            sortable_cells = []
-            for col in self._current_columns:
-                sort_val = col.get_value(self._model, record)
-                cells.append(col.format_value(self._model, record, sort_val))
-                sortable_cells.append(sort_val)
-
-            self._cached_displayable.append(cells)
-            self._cached_sortable.append(sortable_cells)
+            return True
+
+        # records which ended since the previous event_top_data record are
+        # still shown, and events are shown after they occur. Only the
+        # records which became visible or hidden since the last build are
+        # visited to update the set of visible records
+        delta = self._model.alive_delta(
+            TAB_SCHEMAS[tab],
+            self._model.timestamp,
+            self._model.time_elapsed,
+            reset=tab != self._alive_tab,
+        )
+        self._alive_tab = tab
+        if delta.reset:
+            self._alive = {}
+        for record in delta.removed:
+            del self._alive[id(record)]
+        for record in delta.added:
+            self._alive[id(record)] = record
+
+        changed = self._changed_inputs()
+
+        # the rows are rebuilt when the records are reloaded, or when
+        # the columns or the hidden records change
+        rows_for = (
+            tab,
+            id(self._current_columns),
+            self._model.config["hide_threads"],
+            self._model.config["hide_kthreads"],
+        )
+        rows_changed = delta.reset or rows_for != self._rows_for
+        if rows_changed:
+            self._rows_for = rows_for
+            self._rows = {}
+            # cells are only formatted once they are displayed or filtered
+            self._cell_cache = CellCache(self._model, self._current_columns)
+            added = list(self._alive.values())
+        else:
+            count = len(self._rows)
+            for record in delta.removed:
+                self._rows.pop(id(record), None)
+            rows_changed = count != len(self._rows)
+            added = delta.added
+            if self._refresh_cells(changed):
+                rows_changed = True
+
+        # build the rows for the records which became visible, ignoring
+        # the records which are hidden processes
+        records = [record for record in added if not self._is_hidden(tab, record)]
+        # the values are calculated a column at a time, so that columns
+        # with a batch getter can calculate them all at once
+        values = [col.get_values(self._model, records) for col in self._current_columns]
+        for row, record in enumerate(records):
+            sortable_cells = [column[row] for column in values]
+            self._rows[id(record)] = LazyRow(self._cell_cache, record, sortable_cells)
+
+        if not rows_changed and len(records) == 0:
+            return False
+        self._cached_displayable = list(self._rows.values())
+        self._cached_sortable = [row.values for row in self._cached_displayable]
+        return True
+
+    def _changed_inputs(self) -> Dependency:
+        """Find what the cells depend on which changed since the last build"""
+        inputs = {
+            Dependency.TIME: self._model.timestamp,
+            Dependency.RESOURCES: (
+                self._model.get_value("id"),
+                self._model.get_value("id", previous=True),
+            ),
+            Dependency.TIMEZONE: self._model.config["utc_time"],
+            Dependency.RELATED: (self._model.merge_count, id(self._model.machine)),
+        }
+        changed = Dependency.RECORD
+        for dependency, value in inputs.items():
+            if self._row_inputs.get(dependency) != value:
+                changed |= dependency
+        self._row_inputs = inputs
+        return changed
+
+    def _refresh_cells(self, changed: Dependency) -> bool:
+        """Recalculate the cells of the existing rows which depend on
+        something that changed, returning whether there were any"""
+        rows = list(self._rows.values())
+        columns = [
+            (index, col)
+            for index, col in enumerate(self._current_columns)
+            if col.depends & changed
+        ]
+        if len(rows) == 0 or len(columns) == 0:
+            return False
+
+        records = [row.record for row in rows]
+        for index, col in columns:
+            for row, value in zip(rows, col.get_values(self._model, records)):
+                row.values[index] = value
+            self._cell_cache.invalidate(index)
+        return True
+
+    def _is_hidden(self, tab: str, record: Record) -> bool:
+        """Whether a record is a process which is hidden by the settings"""
+        return tab == "processes" and (
+            self._model.config["hide_kthreads"]
+            and record["type"] == "kernel thread"
+            or self._model.config["hide_threads"]
+            and record["type"] == "thread"
+        )
 
     # -- input handling -- #
     def _enable_disable(self):
@@ -480,17 +584,12 @@ class MainFrame(Frame):  # pylint: disable=too-many-instance-attributes
         if row is None:
             return
 
-        def recursive_enable_disable(tree, id_to_ed):
-            for rec_id, branch in tree.items():
-                if branch is None:
-                    continue
-                if rec_id == id_to_ed:
-                    tree[rec_id] = (not branch[0], branch[1])
-                    return
-                recursive_enable_disable(branch[1], id_to_ed)
-
-        recursive_enable_disable(self._model.tree, row[1][0])
-        self.needs_update = True
+        branch = self._model.toggle_branch(row[1][0])
+        if branch is None:
+            return
+        # only the rows under the branch are added or removed
+        self._columns.toggle_branch(row[1][0], branch)
+        self.needs_screen_refresh = True
 
     def _switch_buttons(self, version):
         """Switch the footer buttons to the given version"""
@@ -570,6 +669,7 @@ class MainFrame(Frame):  # pylint: disable=too-many-instance-attributes
         self._model.config["sort_column"] = None
         self._model.config["filter"] = None
         self._cached_options = None
+        self._cached_displayable = []
         self._cached_sortable = []
 
         self._model.log_api(API_LOG_TYPES["navigation"], {"tab": tab_name})
@@ -637,6 +737,7 @@ class MainFrame(Frame):  # pylint: disable=too-many-instance-attributes
         """show the search input modal"""
         self._model.log_api(API_LOG_TYPES["navigation"], {"menu": "search"})
         self._switch_buttons("modal")
+        self._columns.start_search()
 
         def run_search(value):
             if not value:
@@ -644,6 +745,10 @@ class MainFrame(Frame):  # pylint: disable=too-many-instance-attributes
             self._columns.find(value)
             self.needs_screen_refresh = True
 
+        def find_again(find):
+            find()
+            self.needs_screen_refresh = True
+
         assert self.scene is not None, "A scene must be set in the frame before use"
         self.scene.add_effect(
             InputModal(
@@ -652,6 +757,11 @@ class MainFrame(Frame):  # pylint: disable=too-many-instance-attributes
                 theme=self._model.config["theme"],
                 on_change=run_search,
                 on_death=lambda: self._switch_buttons("main"),
+                # move between the matches with the arrow keys
+                key_map={
+                    Screen.KEY_DOWN: lambda: find_again(self._columns.find_next),
+                    Screen.KEY_UP: lambda: find_again(self._columns.find_previous),
+                },
                 validator=self._columns.find,
             )
         )
@@ -766,12 +876,9 @@ class MainFrame(Frame):  # pylint: disable=too-many-instance-attributes
         for (name, value) in zip(
             [c.header_name for c in self._current_columns], row[0]
         ):
-            # remove any tree characters
             if isinstance(value, ColouredText):
                 value = str(value.raw_text)  # type: ignore
             value = value.strip()
-            if name == "Command":
-                value = re.sub(r"^(│  |   )*[├└][─+] ", "", value)
             data_lines += f"${{{label_fg},1}}{name}:${{{field_fg}}} {value}\n"
 
         data_lines = data_lines.rstrip("\n")
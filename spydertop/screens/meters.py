@@ -135,7 +135,7 @@ def show_tasks(model: AppModel):
     if tasks is None:
         return add_palette("  ${{{meter_label}}}Tasks: ${{1,1}}No Data", model)
     # this is necessary because of how tasks seem to be counted
-    processes = model.get_value("processes")
+    processes = model.resource_table()
     if processes is None:
         task_count = "${1,1}Not Available"
     else:
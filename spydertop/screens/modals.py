@@ -10,7 +10,7 @@ A set of modal frames used for temporary input
 """
 
 import re
-from typing import Callable, Optional
+from typing import Callable, Dict, Optional
 from asciimatics.widgets import Frame, Text, Layout, Widget
 from asciimatics.screen import Screen
 from asciimatics.event import KeyboardEvent, MouseEvent
@@ -28,6 +28,7 @@ class InputModal(Frame):
     _on_change: Callable[[Optional[str]], None]
     _on_submit: Callable[[str], None]
     _on_death: Callable[[], None]
+    _key_map: Dict[int, Callable[[], None]]
 
     def __init__(  # pylint: disable=too-many-arguments
         self,
@@ -39,6 +40,7 @@ class InputModal(Frame):
         on_submit: Optional[Callable[[str], None]] = None,
         on_death: Optional[Callable[[], None]] = None,
         widget=Text,
+        key_map: Optional[Dict[int, Callable[[], None]]] = None,
         **kwargs,
     ) -> None:
         """
@@ -50,6 +52,7 @@ class InputModal(Frame):
         :param on_submit: A function to call when the user submits the input
         :param on_death: A function to call when the modal is closed
         :param widget: The widget to use for the input
+        :param key_map: Functions to call when keys are pressed, by key code
         :param kwargs: Any additional keyword arguments to pass to the widget
         """
 
@@ -77,6 +80,7 @@ class InputModal(Frame):
         self._on_change = on_change or (lambda _: None)
         self._on_submit = on_submit or (lambda _: None)
         self._on_death = on_death or (lambda: None)
+        self._key_map = key_map or {}
 
         layout = Layout([1], fill_frame=True)
         self.add_layout(layout)
@@ -92,6 +96,9 @@ class InputModal(Frame):
     def process_event(self, event):
         assert self.scene is not None
         if isinstance(event, KeyboardEvent):
+            if event.key_code in self._key_map:
+                self._key_map[event.key_code]()
+                return None
             if event.key_code == ord("\n") or event.key_code == Screen.KEY_F10:
                 if self._text_input.is_valid:
                     self._on_submit(self._text_input.value)
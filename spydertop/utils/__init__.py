@@ -10,7 +10,7 @@ Various utilities for spydertop
 """
 
 from datetime import datetime, timezone
-from typing import Callable, List, Optional, TypeVar
+from typing import Callable, List, Optional, Tuple, TypeVar
 
 from asciimatics.widgets.utilities import THEMES
 
@@ -92,6 +92,19 @@ def convert_to_seconds(value: str) -> float:
     return timestamp
 
 
+def split_time_span(
+    start: float, end: float, length: float, max_parts: int
+) -> List[Tuple[float, float]]:
+    """Split a time span into consecutive parts of at least the given length,
+    growing the parts if needed so that there are no more than max_parts"""
+    length = max(length, (end - start) / max_parts)
+    parts = []
+    while start < end:
+        parts.append((start, min(start + length, end)))
+        start += length
+    return parts
+
+
 def header_bytes(n_bytes: int) -> str:
     """Format a number of bytes in a human readable format, without coloring for the header"""
     for suffix in ["", "K", "M", "G", "T"]:
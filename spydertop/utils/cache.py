@@ -0,0 +1,281 @@
+#
+# cache.py
+#
+# Author: Griffith Thomas
+# Copyright 2022 Spyderbat, Inc. All rights reserved.
+#
+
+"""
+A persistent on-disk cache of the data fetched from the API, so that
+time windows which have already been fetched can be read from disk
+instead of being downloaded again.
+"""
+
+import gzip
+import os
+import re
+import tempfile
+import threading
+import time
+import zlib
+from typing import IO, List, Optional, Tuple
+
+from spydertop.utils import log
+from spydertop.utils.stream import CHUNK_SIZE, LineStream
+from spydertop.utils.types import TimeSpanTracker
+
+# windows which end less than this many seconds ago may still be missing
+# records which have not yet reached the API, so they are not cached
+SETTLE_TIME = 600
+# once the cache is over its size, entries are evicted until it is within
+# this fraction of it, so that it is not scanned again for every new entry
+EVICT_TO = 0.9
+
+ENTRY_SUFFIX = ".json.gz"
+
+
+def default_cache_dir() -> str:
+    """The default location of the cache, under $HOME/.spyderbat-api"""
+    return os.path.join(
+        os.environ.get("HOME", ""), ".spyderbat-api", "cache"  # type: ignore
+    )
+
+
+def _safe_name(value: str) -> str:
+    """Make a value safe to use as a directory name"""
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", value)
+
+
+class WindowCache:
+    """
+    Caches the responses for API time windows as gzipped JSON-lines files,
+    stored under <directory>/<org>/<machine>/<datatype>/<start>_<end>.json.gz.
+
+    The entries for a time span are found by their names alone, so the cache
+    can be shared between several instances of the application. Entries are
+    evicted in least-recently-used order, using file modification times,
+    once the total size of the cache exceeds max_bytes.
+    """
+
+    directory: str
+    max_bytes: int
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # the total size of the entries, which is counted when the cache is
+        # scanned and kept up to date as entries are stored, so the cache is
+        # only scanned again once it is over max_bytes. Entries stored by
+        # other instances are only counted by the next scan
+        self._total: Optional[int] = None
+
+    def _entry_dir(self, org: str, machine: str, datatype: str) -> str:
+        return os.path.join(
+            self.directory, _safe_name(org), _safe_name(machine), _safe_name(datatype)
+        )
+
+    def lookup(
+        self, org: str, machine: str, datatype: str, start: float, end: float
+    ) -> Tuple[List[str], List[Tuple[float, float]]]:
+        """
+        Find the cached entries which overlap a time span, in order of start
+        time, and the gaps in the time span which are not covered by them
+        """
+        entry_dir = self._entry_dir(org, machine, datatype)
+        try:
+            names = os.listdir(entry_dir)
+        except FileNotFoundError:
+            return [], [(start, end)]
+
+        entries = []
+        for name in names:
+            span = self.entry_span(name)
+            if span is not None and span[0] < end and span[1] > start:
+                entries.append((span[0], span[1], os.path.join(entry_dir, name)))
+        entries.sort()
+
+        tracker = TimeSpanTracker()
+        for entry_start, entry_end, _ in entries:
+            tracker.add_time_span(entry_start, entry_end)
+        # every uncovered gap is fetched, however short, as records may
+        # start and end within it
+        return [path for _, _, path in entries], tracker.gaps(start, end)
+
+    @staticmethod
+    def entry_span(path: str) -> Optional[Tuple[float, float]]:
+        """The time span of a cached entry, from its name, or None if
+        it is not the name of an entry"""
+        name = os.path.basename(path)
+        if not name.endswith(ENTRY_SUFFIX):
+            return None
+        try:
+            start, end = (float(part) for part in name[: -len(ENTRY_SUFFIX)].split("_"))
+        except ValueError:
+            return None
+        return start, end
+
+    def read(self, path: str) -> Optional[LineStream]:
+        """Open a cached entry as a line stream, marking it as recently used.
+        Returns None if the entry was evicted since it was looked up"""
+        try:
+            raw = open(path, "rb")  # pylint: disable=consider-using-with
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # it was evicted after being opened, so it can still be read
+            pass
+        size = os.fstat(raw.fileno()).st_size
+        file = gzip.GzipFile(fileobj=raw, mode="rb")
+
+        def chunks():
+            try:
+                with raw, file:
+                    yield from iter(lambda: file.read(CHUNK_SIZE), b"")
+            except (OSError, EOFError, zlib.error):
+                # the entry is corrupt, so remove it to be fetched again
+                log.warn(f"Removing corrupt cache entry: {path}")
+                _remove(path)
+                raise
+
+        return LineStream(
+            chunks(), lambda: size if raw.closed else raw.tell(), size  # type: ignore
+        )
+
+    @staticmethod
+    def is_cacheable(end: float) -> bool:
+        """Whether a window ending at this time is old enough to cache"""
+        return end < time.time() - SETTLE_TIME
+
+    def store(  # pylint: disable=too-many-arguments
+        self,
+        org: str,
+        machine: str,
+        datatype: str,
+        start: float,
+        end: float,
+        *,
+        stream: LineStream,
+    ) -> LineStream:
+        """
+        Wrap a stream fetched from the API so that its data is saved to the
+        cache as it is read. The entry is only added once the whole stream
+        has been read successfully.
+        """
+        entry_dir = self._entry_dir(org, machine, datatype)
+        path = os.path.join(entry_dir, f"{start}_{end}{ENTRY_SUFFIX}")
+        writer = _EntryWriter(entry_dir, path)
+
+        def close(completed: bool) -> None:
+            if writer.close(completed):
+                self._count(path)
+
+        return stream.tee(writer.write, close)
+
+    def _count(self, path: str) -> None:
+        """Add a stored entry to the total size of the cache, evicting
+        entries if it no longer fits"""
+        with self._lock:
+            if self._total is None:
+                self._total = self._evict()
+                return
+            try:
+                self._total += os.path.getsize(path)
+            except OSError:
+                return
+            if self._total > self.max_bytes:
+                self._total = self._evict()
+
+    def evict(self) -> None:
+        """Remove the least recently used entries if the cache is over max_bytes,
+        until it fits in a fraction of it"""
+        with self._lock:
+            self._total = self._evict()
+
+    def _evict(self) -> int:
+        """Scan the cache and evict entries, returning the size of the rest"""
+        entries = []
+        total = 0
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if not name.endswith(ENTRY_SUFFIX):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        if total <= self.max_bytes:
+            return total
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes * EVICT_TO:
+                break
+            _remove(path)
+            total -= size
+        return total
+
+
+class _EntryWriter:
+    """
+    Writes a cache entry to a temporary file, which is moved into
+    place once complete. Failures to write are logged and otherwise
+    ignored, so that the cache never interrupts loading.
+    """
+
+    def __init__(self, entry_dir: str, path: str):
+        self._entry_dir = entry_dir
+        self._path = path
+        self._temp_path: Optional[str] = None
+        self._raw: Optional[IO[bytes]] = None
+        self._file: Optional[gzip.GzipFile] = None
+        self._broken = False
+
+    def _open(self) -> None:
+        os.makedirs(self._entry_dir, exist_ok=True)
+        handle, self._temp_path = tempfile.mkstemp(dir=self._entry_dir, suffix=".tmp")
+        self._raw = os.fdopen(handle, "wb")
+        self._file = gzip.GzipFile(fileobj=self._raw, mode="wb")
+
+    def write(self, chunk: bytes) -> None:
+        """Write a chunk of the response to the entry"""
+        if self._broken:
+            return
+        try:
+            if self._file is None:
+                self._open()
+            self._file.write(chunk)  # type: ignore
+        except OSError as exc:
+            log.warn(f"Failed to write to the cache: {exc}")
+            self._broken = True
+
+    def close(self, completed: bool) -> bool:
+        """Finish writing the entry, returning whether it was added to the cache"""
+        try:
+            if completed and not self._broken and self._file is None:
+                # empty windows are cached as well
+                self._open()
+            if self._file is not None:
+                self._file.close()
+                self._raw.close()  # type: ignore
+            if completed and not self._broken:
+                os.replace(self._temp_path, self._path)  # type: ignore
+                return True
+        except OSError as exc:
+            log.warn(f"Failed to write to the cache: {exc}")
+        if self._temp_path is not None:
+            _remove(self._temp_path)
+        return False
+
+
+def _remove(path: str) -> None:
+    """Remove a file, ignoring errors"""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,336 @@
+#
+# capture.py
+#
+# Author: Griffith Thomas
+# Copyright 2022 Spyderbat, Inc. All rights reserved.
+#
+
+"""
+An indexed binary capture format for saving loaded records. Records are
+grouped into time-ordered, compressed blocks, and a footer index maps the
+time range and schemas of each block to its location in the file, so that
+only the blocks around a given time need to be read.
+
+A capture file is laid out as:
+
+    MAGIC
+    block 0, block 1, ...       header, then zlib-compressed JSON lines
+    index                       zlib-compressed JSON list of block entries
+    trailer                     index offset, index length, MAGIC
+
+Each block starts with a header holding BLOCK_MARKER and the length of the
+block, so that if the writer did not get to write the index, such as when
+the recording was interrupted, the index can be rebuilt from the blocks.
+"""
+
+import json
+import math
+import mmap
+import re
+import struct
+import zlib
+from typing import (
+    BinaryIO,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from spydertop.utils import log
+from spydertop.utils.decode import classify, record_time, short_schema_of
+from spydertop.utils.stream import LineStream, WindowedFile
+
+MAGIC = b"SPYDCAP1"
+TRAILER = struct.Struct("<QQ8s")
+BLOCK_MARKER = b"BLK1"
+BLOCK_HEADER = struct.Struct("<4sI")
+# files saved with this suffix are written as captures
+CAPTURE_SUFFIX = ".spydercap"
+
+# the uncompressed size of each block
+BLOCK_BYTES = 1024 * 1024
+# the number of blocks worth of records which are sorted by time
+# together before being written, as records do not arrive in order
+SORT_BLOCKS = 8
+
+VALID_FROM_FIELD = re.compile(rb'"valid_from": ?(-?[0-9][0-9.eE+-]*)')
+VALID_TO_FIELD = re.compile(rb'"valid_to": ?(-?[0-9][0-9.eE+-]*)')
+
+
+class CaptureBlock(NamedTuple):
+    """
+    The index entry for a single block of records. For each short schema
+    in the block, spans holds the time span during which the records of
+    that schema are valid, which ends at infinity if any of them have no
+    end of validity.
+    """
+
+    offset: int
+    length: int
+    count: int
+    spans: Dict[str, Tuple[float, float]]
+
+    @staticmethod
+    def from_json(entry: list) -> "CaptureBlock":
+        """Create a block from its JSON-encoded index entry"""
+        offset, length, count, spans = entry
+        return CaptureBlock(
+            offset,
+            length,
+            count,
+            {schema: (span[0], span[1]) for schema, span in spans.items()},
+        )
+
+    def overlaps(
+        self, start: float, end: float, schemas: Optional[Set[str]] = None
+    ) -> bool:
+        """Whether any records of the given schemas are valid during a time span"""
+        return any(
+            span_start <= end and span_end >= start
+            for schema, (span_start, span_end) in self.spans.items()
+            if schemas is None or schema in schemas
+        )
+
+
+def _field(pattern: "re.Pattern[bytes]", line: bytes) -> Optional[float]:
+    match = pattern.search(line)
+    return float(match.group(1)) if match is not None else None
+
+
+def record_span(line: bytes) -> Tuple[str, float, float]:
+    """
+    Read the short schema of an encoded record and the time span during
+    which it is valid. Model records are valid from valid_from until
+    valid_to, or indefinitely if they have no valid_to; all other records
+    are only valid at their time.
+    """
+    short_schema = classify(line)
+    time = record_time(line)
+    if short_schema is None or time is None:
+        try:
+            record = json.loads(line)
+            short_schema = short_schema_of(record.get("schema", ""))
+            time = float(record.get("time", 0))
+        except (ValueError, TypeError, AttributeError):
+            return short_schema or "", time or 0.0, time or 0.0
+
+    if not short_schema.startswith("model_"):
+        return short_schema, time, time
+    valid_from = _field(VALID_FROM_FIELD, line)
+    valid_to = _field(VALID_TO_FIELD, line)
+    return (
+        short_schema,
+        min(valid_from, time) if valid_from is not None else time,
+        max(valid_to, time) if valid_to is not None else math.inf,
+    )
+
+
+def _block_spans(
+    records: Iterable[Tuple[float, float, str]]
+) -> Dict[str, Tuple[float, float]]:
+    """The time span of the records of each short schema in a block"""
+    spans: Dict[str, Tuple[float, float]] = {}
+    for start, end, short_schema in records:
+        if short_schema in spans:
+            span_start, span_end = spans[short_schema]
+            spans[short_schema] = (min(span_start, start), max(span_end, end))
+        else:
+            spans[short_schema] = (start, end)
+    return spans
+
+
+class CaptureWriter:
+    """
+    Writes records to a capture file. Records are buffered and sorted by
+    time before being written in blocks, and the index is written when
+    the writer is closed. Records which are valid indefinitely are kept
+    in separate blocks, so that the other blocks cover short time spans.
+    Blocks are flushed as they are written, so that if the writer is not
+    closed, the blocks written so far can still be read.
+    """
+
+    name: str
+
+    def __init__(self, file: BinaryIO):
+        self.name = getattr(file, "name", "")
+        self._file = file
+        self._file.write(MAGIC)
+        self._offset = len(MAGIC)
+        # pending records, by whether they are valid indefinitely
+        self._pending: Dict[bool, List[Tuple[float, float, str, bytes]]] = {
+            False: [],
+            True: [],
+        }
+        self._pending_bytes = 0
+        self._blocks: List[CaptureBlock] = []
+
+    @staticmethod
+    def open(path: str) -> "CaptureWriter":
+        """Create a capture file at the given path"""
+        return CaptureWriter(open(path, "wb"))  # pylint: disable=consider-using-with
+
+    def write_record(self, line: bytes) -> None:
+        """Add a JSON-encoded record to the capture"""
+        line = line.rstrip()
+        if not line:
+            return
+        short_schema, start, end = record_span(line)
+        self._pending[end == math.inf].append((start, end, short_schema, line))
+        self._pending_bytes += len(line) + 1
+        if self._pending_bytes >= BLOCK_BYTES * SORT_BLOCKS:
+            self._flush()
+
+    def _flush(self) -> None:
+        """Sort the pending records by time and write them as blocks"""
+        for records in self._pending.values():
+            records.sort(key=lambda record: record[0])
+            start = 0
+            size = 0
+            for index, (_, _, _, line) in enumerate(records):
+                size += len(line) + 1
+                if size >= BLOCK_BYTES:
+                    self._write_block(records[start : index + 1])
+                    start = index + 1
+                    size = 0
+            if start < len(records):
+                self._write_block(records[start:])
+            records.clear()
+        self._pending_bytes = 0
+
+    def _write_block(self, records: List[Tuple[float, float, str, bytes]]) -> None:
+        data = zlib.compress(b"".join(line + b"\n" for _, _, _, line in records))
+        self._file.write(BLOCK_HEADER.pack(BLOCK_MARKER, len(data)))
+        self._file.write(data)
+        self._file.flush()
+
+        spans = _block_spans(record[:3] for record in records)
+        self._offset += BLOCK_HEADER.size
+        self._blocks.append(CaptureBlock(self._offset, len(data), len(records), spans))
+        self._offset += len(data)
+
+    def close(self) -> None:
+        """Write any remaining records and the index, then close the file"""
+        if self._file.closed:
+            return
+        self._flush()
+        index = zlib.compress(json.dumps(self._blocks).encode("utf-8"))
+        self._file.write(index)
+        self._file.write(TRAILER.pack(self._offset, len(index), MAGIC))
+        self._file.close()
+
+
+class CaptureReader(WindowedFile):
+    """
+    Reads records from a capture file, which is memory-mapped so
+    that blocks can be decompressed directly from the file. If the
+    file has no index, it is rebuilt from the blocks in the file.
+    """
+
+    name: str
+    blocks: List[CaptureBlock]
+
+    def __init__(self, path: str):
+        self.name = path
+        self._file = open(path, "rb")  # pylint: disable=consider-using-with
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            if len(self._map) < len(MAGIC) + TRAILER.size:
+                raise ValueError("The capture file is truncated")
+            index_offset, index_length, magic = TRAILER.unpack_from(
+                self._map, len(self._map) - TRAILER.size
+            )
+            if magic == MAGIC:
+                index = json.loads(
+                    zlib.decompress(
+                        self._map[index_offset : index_offset + index_length]
+                    )
+                )
+                self.blocks = [CaptureBlock.from_json(entry) for entry in index]
+            else:
+                log.warn(f"The capture {path} has no index, rebuilding it")
+                self.blocks = self._scan_blocks()
+                if len(self.blocks) == 0:
+                    raise ValueError(
+                        "The capture file has no index or complete blocks, "
+                        "it may not have been closed"
+                    )
+        except Exception:
+            self._file.close()
+            raise
+
+    def _scan_blocks(self) -> List[CaptureBlock]:
+        """Rebuild the index by reading the blocks in the file, up to the
+        first block which is incomplete"""
+        blocks = []
+        offset = len(MAGIC)
+        while offset + BLOCK_HEADER.size <= len(self._map):
+            marker, length = BLOCK_HEADER.unpack_from(self._map, offset)
+            offset += BLOCK_HEADER.size
+            if marker != BLOCK_MARKER or offset + length > len(self._map):
+                break
+            try:
+                data = zlib.decompress(self._map[offset : offset + length])
+            except zlib.error:
+                break
+            records = []
+            for line in data.splitlines():
+                if line:
+                    short_schema, start, end = record_span(line)
+                    records.append((start, end, short_schema))
+            blocks.append(
+                CaptureBlock(offset, length, len(records), _block_spans(records))
+            )
+            offset += length
+        return blocks
+
+    def start_time(self, schema_prefix: str = "") -> Optional[float]:
+        """The earliest time at which a record with a short schema
+        starting with schema_prefix is valid in the capture"""
+        return min(
+            (
+                span[0]
+                for block in self.blocks
+                for schema, span in block.spans.items()
+                if schema.startswith(schema_prefix)
+            ),
+            default=None,
+        )
+
+    def find_blocks(
+        self, start: float, end: float, schemas: Optional[Set[str]] = None
+    ) -> List[CaptureBlock]:
+        """Find the blocks containing records which are valid during a time
+        span, optionally only those with records of the given schemas"""
+        return [block for block in self.blocks if block.overlaps(start, end, schemas)]
+
+    def stream(
+        self, start: float, end: float, schemas: Optional[Set[str]] = None
+    ) -> LineStream:
+        """Read the records in the blocks overlapping a time span. Progress is
+        measured in the compressed bytes of the blocks read"""
+        blocks = self.find_blocks(start, end, schemas)
+        position = [0]
+
+        def chunks() -> Iterator[bytes]:
+            for block in blocks:
+                data = zlib.decompress(
+                    self._map[block.offset : block.offset + block.length]
+                )
+                position[0] += block.length
+                yield data
+
+        return LineStream(
+            chunks(),
+            lambda: position[0],
+            sum(block.length for block in blocks),
+        )
+
+    def close(self) -> None:
+        """Unmap and close the capture file"""
+        self._map.close()
+        self._file.close()
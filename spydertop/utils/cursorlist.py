@@ -10,6 +10,9 @@ A cursor-based list which indexes based off of an arbitrary
 cursor position.
 """
 
+from bisect import bisect_right
+from heapq import merge
+from operator import itemgetter
 from typing import Any, Dict, Generic, List, Optional, TypeVar
 
 CT = TypeVar("CT")
@@ -27,8 +30,9 @@ class CursorList(Generic[CT]):
     to the cursor without exceeding it. If all rows are greater than the cursor,
     the index will be -1, and [0] will not be valid.
 
-    When changing the cursor, CursorList will move its index towards the cursor
-    until the previous conditions are satisfied.
+    The keys of the data are kept in a separate sorted list, so the index for
+    a cursor is found with a binary search, and new data is merged into place
+    rather than re-sorting everything.
     """
 
     data: List[Dict]
@@ -39,6 +43,7 @@ class CursorList(Generic[CT]):
     def __init__(self, key: str, data: List[Dict], cursor: CT):
         self.key = key
         self.data = data
+        self._keys: List[Any] = []
         if cursor:
             self.cursor = cursor
         if len(self.data) == 0:
@@ -46,74 +51,39 @@ class CursorList(Generic[CT]):
         self._update_data()
 
     def extend(self, new_data: List[Dict]):
-        """Appends new_data onto the existing cursorlist"""
+        """Adds new_data to the cursorlist, keeping it sorted"""
+        if len(new_data) == 0:
+            return
+        get_key = itemgetter(self.key)
+        new_data = sorted(new_data, key=get_key)
+
+        # new data usually follows the existing data, in which case it is
+        # appended; otherwise, only the overlapping part is merged
+        start = bisect_right(self._keys, get_key(new_data[0]))
+        if start < len(self.data):
+            new_data = list(merge(self.data[start:], new_data, key=get_key))
+            del self.data[start:]
+            del self._keys[start:]
         self.data.extend(new_data)
-        self._update_data()
+        self._keys.extend(get_key(item) for item in new_data)
+        self.update_cursor()
 
     def _update_data(self):
         """This *must* be called after any change to data. It corrects
         internal state related to the data"""
-        if len(self.data) > 0:
-            self.data.sort(key=lambda x: x[self.key])
+        self.data.sort(key=itemgetter(self.key))
+        self._keys = [item[self.key] for item in self.data]
         self.update_cursor()
 
     def update_cursor(self, new_cursor: Optional[CT] = None):
         """Updates the cursor location"""
-        # this function is needed to ensure that the index is
-        # valid. It will be reset, or updated to the nearest
-        # valid location according to the requirements
-        # listed above
         if new_cursor:
             self.cursor = new_cursor
         if self.cursor is None:
             self.index = -1
             return
-
-        # case: index was invalid
-        if self.index == -1:
-            self.index = int(len(self.data) / 2)
-
-        # case: data is empty
-        if len(self.data) == 0:
-            self.index = -1
-            return
-
-        key_vals = [v[self.key] for v in self.data[:]]
-
-        # case: cursor is below the list
-        if key_vals[0] > self.cursor:
-            self.index = -1
-            return
-
-        # case: cursor is above the list
-        if key_vals[len(self.data) - 1] <= self.cursor:
-            self.index = len(self.data) - 1
-            return
-
-        # case: cursor is in list or above it
-        direction = 1 if key_vals[self.index] <= self.cursor else -1
-
-        while True:
-            if (
-                key_vals[self.index] <= self.cursor
-                and key_vals[self.index + 1] > self.cursor
-            ):
-                break
-            self.index += direction
-
-            # out-of-bounds check
-            if self.index < 0:
-                self.index = -1
-                break
-            if self.index + 1 >= len(self.data):
-                self.index = len(self.data) - 1
-                break
-
-        # assert that the cursorlist is in a valid state
-        if self.index < 0 or self.index + 1 >= len(self.data):
-            return
-        assert self.data[self.index][self.key] <= self.cursor
-        assert self.data[self.index + 1][self.key] > self.cursor
+        # the last item at or before the cursor, or -1 if there is none
+        self.index = bisect_right(self._keys, self.cursor) - 1
 
     def is_valid(self, index: int):
         """Returns True if the index is valid, False otherwise"""
@@ -0,0 +1,383 @@
+#
+# decode.py
+#
+# Author: Griffith Thomas
+# Copyright 2022 Spyderbat, Inc. All rights reserved.
+#
+
+"""
+Decoding of JSON-lines records into the form stored by the model. Lines are
+decoded in chunks, either in the calling thread or across a pool of worker
+processes.
+"""
+
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+import json
+from math import inf
+import multiprocessing
+import re
+import sys
+import threading
+from typing import (
+    AbstractSet,
+    Any,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from spydertop.utils.types import Record
+
+# the short schemas of the records which are stored by the model
+RECORD_SCHEMAS = [
+    "model_process",
+    "model_session",
+    "model_connection",
+    "model_machine",
+    "model_listening_socket",
+    "event_redflag",
+    "model_container",
+]
+
+# the number of lines decoded together as a single unit of work
+CHUNK_LINES = 1000
+
+# records are almost always encoded with the schema as the first field,
+# followed by the id, which allows them to be classified without decoding
+SCHEMA_PREFIX = b'{"schema":"'
+SCHEMA_FIELD = b'"schema":"'
+TOP_ID_FIELD = b'","id":"'
+TIME_FIELD = re.compile(rb'"time": ?(-?[0-9][0-9.eE+-]*)')
+
+
+class DecodedChunk(NamedTuple):
+    """The results of decoding a chunk of lines"""
+
+    # (short schema, record) pairs, keeping only the latest version of
+    # each record in the chunk, in the order they first appeared
+    records: List[Tuple[str, Record]]
+    # event_top records, in the order they appeared
+    tops: List[Record]
+    # the number of non-empty lines in the chunk
+    count: int
+    # messages for lines which could not be decoded
+    errors: List[str]
+
+
+def record_key(short_schema: str, record: Record) -> str:
+    """The key a record is stored under in the model"""
+    if short_schema == "model_container":
+        return record["container_id"]
+    return record["id"]
+
+
+def is_newer(short_schema: str, record: Record, existing: Record) -> bool:
+    """Whether a record should replace the existing version of itself"""
+    # containers are always replaced by the latest record to arrive,
+    # everything else by the record with the latest time
+    return short_schema == "model_container" or record["time"] > existing["time"]
+
+
+def valid_span(record: Record) -> Tuple[float, float, Record]:
+    """The time span during which a record is shown, with the record itself.
+    Models are valid from valid_from until valid_to, events from their time
+    onwards, and records with neither are always valid"""
+    if "valid_from" in record:
+        valid_to = record.get("valid_to")
+        return record["valid_from"], valid_to if valid_to is not None else inf, record
+    if "time" in record:
+        return record["time"], inf, record
+    return -inf, inf, record
+
+
+def short_schema_of(schema: str) -> str:
+    """Reduce a full schema to the short schema used to group records"""
+    if schema.startswith("model_container"):
+        return "model_container"
+    return schema.split(":")[0]
+
+
+def classify(line: Union[str, bytes]) -> Optional[str]:
+    """
+    Read the short schema of an encoded record without decoding it. Returns
+    None if the schema cannot be located cheaply, in which case the record
+    must be fully decoded to be classified.
+    """
+    if not isinstance(line, bytes):
+        return None
+    if line.startswith(SCHEMA_PREFIX):
+        start = len(SCHEMA_PREFIX)
+    else:
+        # some record types are encoded with sorted keys, so
+        # the schema is not necessarily the first field
+        start = line.find(SCHEMA_FIELD)
+        if start == -1:
+            return None
+        start += len(SCHEMA_FIELD)
+    end = line.find(b'"', start)
+    if end == -1:
+        return None
+    return short_schema_of(line[start:end].decode("utf-8", "replace"))
+
+
+def record_time(line: bytes) -> Optional[float]:
+    """Read the time of an encoded record without decoding it. Returns
+    None if the time cannot be located cheaply"""
+    match = TIME_FIELD.search(line)
+    if match is None:
+        return None
+    try:
+        return float(match.group(1))
+    except ValueError:
+        return None
+
+
+def _top_id(line: bytes) -> Optional[str]:
+    """Read the id of an event_top record without decoding it, if the
+    id directly follows the schema"""
+    start = line.find(b'"', len(SCHEMA_PREFIX))
+    if not line.startswith(TOP_ID_FIELD, start):
+        return None
+    start += len(TOP_ID_FIELD)
+    end = line.find(b'"', start)
+    if end == -1:
+        return None
+    return line[start:end].decode("utf-8", "replace")
+
+
+class _ChunkBuilder:
+    """Accumulates the records decoded from a chunk of lines"""
+
+    def __init__(self, known_top_ids: AbstractSet[str]):
+        self.latest: Dict[Tuple[str, str], Record] = {}
+        self.tops: List[Record] = []
+        self.top_ids = set(known_top_ids)
+        self.errors: List[str] = []
+
+    def _loads(self, line: Union[str, bytes]) -> Optional[Record]:
+        try:
+            return json.loads(line)
+        except json.JSONDecodeError as exc:
+            self.errors.append(f"Error decoding record: {line!r} ({exc})")
+            return None
+
+    def add_top(self, line: Union[str, bytes]) -> None:
+        """Decode an event_top record, skipping ones that are already known"""
+        if isinstance(line, bytes) and line.startswith(SCHEMA_PREFIX):
+            top_id = _top_id(line)
+            if top_id is not None and top_id in self.top_ids:
+                return
+        record = self._loads(line)
+        if record is not None:
+            self._route_top(record)
+
+    def add_model(self, line: Union[str, bytes], short_schema: str) -> None:
+        """Decode a record which is stored by the model"""
+        record = self._loads(line)
+        if record is not None:
+            self._route_model(record, short_schema)
+
+    def add_unclassified(self, line: Union[str, bytes]) -> None:
+        """Decode a record whose schema could not be read beforehand"""
+        record = self._loads(line)
+        if record is None:
+            return
+        short_schema = short_schema_of(record.get("schema", ""))
+        if short_schema.startswith("event_top"):
+            self._route_top(record)
+        elif short_schema in RECORD_SCHEMAS:
+            self._route_model(record, short_schema)
+
+    def _route_top(self, record: Record) -> None:
+        if record["id"] not in self.top_ids:
+            self.top_ids.add(record["id"])
+            self.tops.append(record)
+
+    def _route_model(self, record: Record, short_schema: str) -> None:
+        key = (short_schema, record_key(short_schema, record))
+        existing = self.latest.get(key)
+        if existing is None or is_newer(short_schema, record, existing):
+            self.latest[key] = record
+
+
+# the types of decoded values which are never shared
+SCALAR_TYPES = frozenset([int, float, bool, type(None)])
+# the most lists and dicts the interner keeps shared copies of at once
+INTERN_POOL_SIZE = 50_000
+
+
+class RecordInterner:  # pylint: disable=too-few-public-methods
+    """
+    Shares a single copy of the values which are repeated across records,
+    such as schemas, machine ids, user names and the command lines and
+    environments that threads share with their parents. Strings are
+    interned, and lists of strings and dicts of strings are hash-consed, so
+    identical ones are stored once. Records are rebuilt with the shared
+    values, so interned records are read-only: modifying a list or dict in
+    one of them would modify it in every record which shares it.
+
+    The pool of shared lists and dicts is emptied once it holds
+    INTERN_POOL_SIZE values, so it does not grow for the whole session.
+    Records interned before then keep sharing their values.
+    """
+
+    def __init__(self):
+        self._values: Dict[Tuple, Union[list, dict]] = {}
+
+    def intern_record(self, record: Record) -> Record:
+        """Rebuild a decoded record using the shared copies of its values"""
+        value = self._value
+        return {
+            sys.intern(key): item if type(item) in SCALAR_TYPES else value(item)
+            for key, item in record.items()
+        }
+
+    def _value(self, value: Any) -> Any:
+        if isinstance(value, str):
+            return sys.intern(value)
+        if isinstance(value, dict):
+            if not all(isinstance(item, str) for item in value.values()):
+                return self.intern_record(value)
+            # dicts are keyed by their names and values in a single flat tuple,
+            # with a marker to keep them apart from lists of strings
+            key: Tuple = (dict,) + tuple(
+                sys.intern(text) for pair in value.items() for text in pair
+            )
+            shared = self._values.get(key)
+            if shared is None:
+                shared = self._share(key, dict(zip(key[1::2], key[2::2])))
+            return shared
+        if isinstance(value, list):
+            if not all(isinstance(item, str) for item in value):
+                return [
+                    item if type(item) in SCALAR_TYPES else self._value(item)
+                    for item in value
+                ]
+            key = tuple(sys.intern(item) for item in value)
+            shared = self._values.get(key)
+            if shared is None:
+                shared = self._share(key, list(key))
+            return shared
+        return value
+
+    def _share(self, key: Tuple, value: Union[list, dict]) -> Union[list, dict]:
+        if len(self._values) >= INTERN_POOL_SIZE:
+            self._values = {}
+        self._values[key] = value
+        return value
+
+
+def decode_chunk(
+    lines: List[Union[str, bytes]], known_top_ids: AbstractSet[str] = frozenset()
+) -> DecodedChunk:
+    """
+    Decode a chunk of lines, routing each record by its schema. The schema
+    is read from the encoded line first, so records the model does not store
+    are skipped without being decoded, as are event_top records whose ids
+    are in known_top_ids.
+    """
+    builder = _ChunkBuilder(known_top_ids)
+    count = 0
+
+    for line in lines:
+        # suppress errors for empty lines
+        if not line.strip():
+            continue
+        count += 1
+
+        short_schema = classify(line)
+        if short_schema is None:
+            builder.add_unclassified(line)
+        elif short_schema.startswith("event_top"):
+            builder.add_top(line)
+        elif short_schema in RECORD_SCHEMAS:
+            builder.add_model(line, short_schema)
+
+    return DecodedChunk(
+        [(key[0], record) for key, record in builder.latest.items()],
+        builder.tops,
+        count,
+        builder.errors,
+    )
+
+
+class ChunkDecoder:
+    """
+    Splits a stream of lines into chunks and decodes them. With no workers,
+    chunks are decoded in the calling thread; otherwise, they are decoded in
+    a pool of worker processes, which keeps json decoding from competing with
+    the UI thread. In either case, decoded chunks are produced in the same
+    order as the lines they came from.
+    """
+
+    workers: int
+    _pool: Optional[ProcessPoolExecutor] = None
+
+    def __init__(self, workers: int = 0):
+        self.workers = workers
+        # the decoder is shared by the loading and prefetching threads
+        self._pool_lock = threading.Lock()
+
+    def decode(
+        self,
+        lines: Iterable[Union[str, bytes]],
+        known_top_ids: AbstractSet[str] = frozenset(),
+    ) -> Iterator[DecodedChunk]:
+        """Decode the lines, yielding each chunk as soon as it is ready.
+        Event_top records with ids in known_top_ids are skipped"""
+        if self.workers <= 0:
+            for chunk in _chunked(lines):
+                yield decode_chunk(chunk, known_top_ids)
+            return
+
+        # the pool receives a copy of the known ids with each chunk
+        known_top_ids = frozenset(known_top_ids)
+
+        pool = self._get_pool()
+
+        # limit the number of chunks in flight, so that memory stays bounded
+        # when lines arrive faster than they can be decoded
+        pending: Deque[Future] = deque()
+        for chunk in _chunked(lines):
+            pending.append(pool.submit(decode_chunk, chunk, known_top_ids))
+            if len(pending) >= self.workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        """The pool of worker processes, which is started once"""
+        with self._pool_lock:
+            if self._pool is None:
+                # workers are spawned rather than forked, as the application
+                # is multi-threaded by the time records are loaded
+                self._pool = ProcessPoolExecutor(
+                    self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._pool
+
+    def close(self) -> None:
+        """Shut down the worker processes, if any were started"""
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+
+
+def _chunked(lines: Iterable[Union[str, bytes]]) -> Iterator[List[Union[str, bytes]]]:
+    """Group lines into lists of up to CHUNK_LINES lines"""
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= CHUNK_LINES:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
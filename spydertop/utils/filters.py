@@ -0,0 +1,306 @@
+#
+# filters.py
+#
+# Author: Griffith Thomas
+# Copyright 2022 Spyderbat, Inc. All rights reserved.
+#
+
+"""
+Filter and search strings for the table, compiled once against its
+columns into a predicate over its rows, and the indexes of the values
+of the columns used to answer the parts which match a single column.
+"""
+
+from bisect import bisect_left, bisect_right
+from math import isnan
+from operator import itemgetter
+import re
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+from spydertop.constants.columns import Column
+
+# a column match at the start of a filter, such as "PID: <1000"
+MATCH_REGEX = re.compile(r"\s*(\S+): ?(\S+)( +|$)")
+
+# the kinds of column matches
+LESS_THAN = 0
+GREATER_THAN = 1
+EXCLUDES = 2
+CONTAINS = 3
+
+Row = Tuple[Sequence[Any], List[Any]]
+
+
+def parse_filter(value: str) -> Tuple[List[Tuple[str, str]], str]:
+    """
+    Parse a filter string into a list of tuples of the form (column, value),
+    and the rest of the string.
+    """
+    column_matches = []
+    match = re.match(MATCH_REGEX, value)
+    while match:
+        column_matches.append((match.group(1), match.group(2)))
+        value = value[match.end() :]
+        match = re.match(MATCH_REGEX, value)
+    return column_matches, value.strip()
+
+
+def compile_matches(
+    column_matches: List[Tuple[str, str]], columns: List[Column]
+) -> List[Tuple[int, int, Any]]:
+    """Compile column matches into tuples of their kind, the index of their
+    column, and what they match, leaving out matches for unknown columns"""
+    names = [col.header_name.lower() for col in columns]
+    clauses: List[Tuple[int, int, Any]] = []
+    for name, match in column_matches:
+        if name.lower() not in names:
+            continue
+        index = names.index(name.lower())
+        if match[0] in {"<", ">"}:
+            try:
+                threshold: Optional[float] = float(match[1:])
+            except ValueError:
+                # only rows without a value are excluded
+                threshold = None
+            kind = LESS_THAN if match[0] == "<" else GREATER_THAN
+            clauses.append((kind, index, threshold))
+        elif match[0] == "!":
+            clauses.append((EXCLUDES, index, match[1:]))
+        else:
+            clauses.append((CONTAINS, index, match))
+    return clauses
+
+
+class NumericIndex:
+    """
+    The rows of a numeric column sorted by their values, for finding the
+    rows above or below a threshold by binary search. Rows are identified
+    by the id of their sortable values. Rows without a value are left
+    out, and rows whose value is NaN are found by every search, as they
+    are never excluded when compared with a threshold.
+    """
+
+    def __init__(self, keys: List[int], values: List[Any]):
+        entries = [
+            (key, value) for key, value in zip(keys, values) if value is not None
+        ]
+        self.unordered = {key for key, value in entries if isnan(value)}
+        if self.unordered:
+            entries = [entry for entry in entries if entry[0] not in self.unordered]
+        entries.sort(key=itemgetter(1))
+        self.keys = [entry[0] for entry in entries]
+        self.values = [entry[1] for entry in entries]
+
+    def below(self, threshold: Optional[float]) -> Set[int]:
+        """The rows with a value below the threshold, or with any
+        value if there is no threshold"""
+        end = (
+            len(self.keys) if threshold is None else bisect_left(self.values, threshold)
+        )
+        return self.unordered.union(self.keys[:end])
+
+    def above(self, threshold: Optional[float]) -> Set[int]:
+        """The rows with a value above the threshold, or with any
+        value if there is no threshold"""
+        start = 0 if threshold is None else bisect_right(self.values, threshold)
+        return self.unordered.union(self.keys[start:])
+
+
+class TextIndex:  # pylint: disable=too-few-public-methods
+    """
+    The rows of a column grouped by the text of their cells, so that
+    a match against the column only checks each distinct text once.
+    """
+
+    def __init__(self, keys: List[int], cells: List[str]):
+        self.groups: Dict[str, List[int]] = {}
+        for key, cell in zip(keys, cells):
+            self.groups.setdefault(cell, []).append(key)
+
+    def containing(self, text: str, negated: bool = False) -> Set[int]:
+        """The rows whose cell contains the text, or does not contain it"""
+        keys: Set[int] = set()
+        for cell, group in self.groups.items():
+            if (text in cell) != negated:
+                keys.update(group)
+        return keys
+
+
+class ColumnIndexes:  # pylint: disable=too-few-public-methods
+    """
+    The indexes over the columns of a set of rows, which are built for a
+    column the first time a filter matches against it. Numeric columns
+    are indexed by their sortable values, and every column by the text of
+    its cells. The indexes must be replaced when the rows change.
+    """
+
+    def __init__(self, rows: List[Row], columns: List[Column]):
+        self.rows = rows
+        self.columns = columns
+        self._keys: Optional[List[int]] = None
+        self._numeric: Dict[int, Optional[NumericIndex]] = {}
+        self._text: Dict[int, TextIndex] = {}
+
+    def lookup(self, kind: int, index: int, arg: Any) -> Optional[Set[int]]:
+        """The rows which match a column match, or None if it cannot be
+        answered by an index"""
+        if kind in (LESS_THAN, GREATER_THAN):
+            numeric = self._numeric_index(index)
+            if numeric is None:
+                return None
+            return numeric.below(arg) if kind == LESS_THAN else numeric.above(arg)
+        return self._text_index(index).containing(arg, kind == EXCLUDES)
+
+    def containing(self, text: str, indices: List[int]) -> Set[int]:
+        """The rows with a cell in any of the columns which contains the text"""
+        keys: Set[int] = set()
+        for index in indices:
+            keys |= self._text_index(index).containing(text)
+        return keys
+
+    def _numeric_index(self, index: int) -> Optional[NumericIndex]:
+        if index not in self._numeric:
+            numeric = None
+            if self.columns[index].value_type in {int, float}:
+                try:
+                    numeric = NumericIndex(
+                        self._row_keys(), [row[1][index] for row in self.rows]
+                    )
+                except TypeError:
+                    # some of the values are not numbers
+                    pass
+            self._numeric[index] = numeric
+        return self._numeric[index]
+
+    def _row_keys(self) -> List[int]:
+        if self._keys is None:
+            self._keys = [id(row[1]) for row in self.rows]
+        return self._keys
+
+    def _text_index(self, index: int) -> TextIndex:
+        text = self._text.get(index)
+        if text is None:
+            text = TextIndex(
+                self._row_keys(), [str(row[0][index]) for row in self.rows]
+            )
+            self._text[index] = text
+        return text
+
+
+class RowFilter:  # pylint: disable=too-many-instance-attributes
+    """
+    A filter string compiled against the columns of a table. Column matches
+    are resolved to the index of their column, and numeric thresholds are
+    parsed, when the filter is compiled rather than for each row; matches
+    for unknown columns are ignored. The rest of the string is matched
+    against the text of the enabled cells. Whether each row matches is
+    kept, so the filter should only be used while the rows are unchanged.
+
+    If indexes over the rows are given, the column matches are answered
+    by them, as are the words of the rest of the string, and only the
+    rows they all found are checked further.
+    """
+
+    def __init__(
+        self,
+        value: str,
+        columns: List[Column],
+        indexes: Optional[ColumnIndexes] = None,
+    ):
+        column_matches, rest = parse_filter(value)
+        self.clauses = compile_matches(column_matches, columns)
+        self.negated = rest.startswith("!")
+        self.text = rest[1:] if self.negated else rest
+        self.indices = [i for i, col in enumerate(columns) if col.enabled]
+        self._results: Dict[int, bool] = {}
+
+        # the rows found by the indexes, and the matches left to check
+        self.candidates: Optional[Set[int]] = None
+        self._row_clauses = []
+        for clause in self.clauses:
+            found = indexes.lookup(*clause) if indexes is not None else None
+            if found is None:
+                self._row_clauses.append(clause)
+            else:
+                self._narrow(found)
+
+        # each word of the text must be in one of the cells, so the rows are
+        # found by the words. Text without spaces cannot span several cells,
+        # so the rows found do not need to be checked against it
+        self._row_text = self.text
+        if indexes is not None and self.text and not self.negated:
+            for word in self.text.split(" "):
+                if word:
+                    self._narrow(indexes.containing(word, self.indices))
+            if " " not in self.text:
+                self._row_text = ""
+
+    def _narrow(self, found: Set[int]) -> None:
+        if self.candidates is None:
+            self.candidates = found
+        else:
+            self.candidates &= found
+
+    def __call__(self, row: Row) -> bool:
+        if self.candidates is not None and id(row[1]) not in self.candidates:
+            return False
+        return self._check(row)
+
+    def filter(self, rows: List[Row]) -> List[Row]:
+        """The rows which match the filter, in the same order"""
+        candidates = self.candidates
+        if candidates is None:
+            return [row for row in rows if self._check(row)]
+        if not self._row_clauses and not self._row_text and not self.negated:
+            return [row for row in rows if id(row[1]) in candidates]
+        return [row for row in rows if id(row[1]) in candidates and self._check(row)]
+
+    def _check(self, row: Row) -> bool:
+        """Whether a row found by the indexes matches the rest of the filter"""
+        key = id(row[1])
+        result = self._results.get(key)
+        if result is None:
+            result = self._matches(row[0], row[1])
+            self._results[key] = result
+        return result
+
+    def _matches(  # pylint: disable=too-many-return-statements
+        self, cells: Sequence[Any], values: List[Any]
+    ) -> bool:
+        for kind, index, arg in self._row_clauses:
+            if kind in (LESS_THAN, GREATER_THAN):
+                value = values[index]
+                if value is None:
+                    return False
+                try:
+                    if arg is not None and (
+                        value >= arg if kind == LESS_THAN else value <= arg
+                    ):
+                        return False
+                except TypeError:
+                    # the column is not numeric
+                    return False
+            elif (arg in str(cells[index])) == (kind == EXCLUDES):
+                return False
+
+        text = self._row_text
+        if not text:
+            return not self.negated
+        # text without spaces cannot span the space between cells,
+        # so the cells do not need to be joined
+        if " " in text:
+            found = text in " ".join(str(cells[i]) for i in self.indices)
+        else:
+            found = any(text in str(cells[i]) for i in self.indices)
+        return found != self.negated
+
+    def narrows(self, other: "RowFilter") -> bool:
+        """Whether every row which matches this filter also matches another,
+        so that only the rows matched by the other need to be checked"""
+        return (
+            self.clauses == other.clauses
+            and self.indices == other.indices
+            and not self.negated
+            and not other.negated
+            and other.text in self.text
+        )
@@ -0,0 +1,226 @@
+#
+# intervals.py
+#
+# Author: Griffith Thomas
+# Copyright 2022 Spyderbat, Inc. All rights reserved.
+#
+
+"""
+An index of items by the time interval during which they are valid,
+for finding the items which are valid at a given time, and for tracking
+the changes to the valid items as the time moves.
+"""
+
+from bisect import bisect_left, bisect_right
+from typing import (
+    Any,
+    Generic,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+)
+
+T = TypeVar("T")
+
+
+class _Node:  # pylint: disable=too-few-public-methods
+    """
+    A node of a centered interval tree, holding the intervals which
+    contain its center. Intervals entirely before the center are in the
+    left subtree, and those entirely after it are in the right subtree.
+    """
+
+    __slots__ = (
+        "center",
+        "starts",
+        "start_positions",
+        "ends",
+        "end_positions",
+        "left",
+        "right",
+    )
+
+    def __init__(self, center: float, entries: List[Tuple[float, float, int]]):
+        self.center = center
+        by_start = sorted(entries, key=lambda entry: entry[0])
+        self.starts = [entry[0] for entry in by_start]
+        self.start_positions = [entry[2] for entry in by_start]
+        by_end = sorted(entries, key=lambda entry: entry[1])
+        self.ends = [entry[1] for entry in by_end]
+        self.end_positions = [entry[2] for entry in by_end]
+        self.left: Optional[_Node] = None
+        self.right: Optional[_Node] = None
+
+
+class IntervalIndex(Generic[T]):
+    """
+    A static centered interval tree over items and the closed intervals
+    during which they are valid. Finding the items which overlap a time
+    span takes O(log n + k) time for k results. Intervals may start at
+    negative infinity or end at infinity. The index is built once, so it
+    must be rebuilt when the items change.
+    """
+
+    def __init__(self, intervals: Iterable[Tuple[float, float, T]]):
+        self.items: List[T] = []
+        self.spans: List[Tuple[float, float]] = []
+        for start, end, item in intervals:
+            # intervals which end before they start are treated as instants
+            self.spans.append((start, max(start, end)))
+            self.items.append(item)
+        self._root = self._build(
+            [(start, end, position) for position, (start, end) in enumerate(self.spans)]
+        )
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    @staticmethod
+    def _build(entries: List[Tuple[float, float, int]]) -> Optional[_Node]:
+        """Build the tree iteratively, so that deep trees cannot
+        exceed the recursion limit"""
+        root: Optional[_Node] = None
+        stack: List[Tuple[List[Tuple[float, float, int]], Optional[_Node], bool]] = [
+            (entries, None, False)
+        ]
+        while stack:
+            entries, parent, is_right = stack.pop()
+            if len(entries) == 0:
+                continue
+            # the median start is contained by at least one interval,
+            # so every node holds at least one interval
+            center = sorted(entry[0] for entry in entries)[len(entries) // 2]
+            here, left, right = [], [], []
+            for entry in entries:
+                if entry[1] < center:
+                    left.append(entry)
+                elif entry[0] > center:
+                    right.append(entry)
+                else:
+                    here.append(entry)
+
+            node = _Node(center, here)
+            if parent is None:
+                root = node
+            elif is_right:
+                parent.right = node
+            else:
+                parent.left = node
+            stack.append((left, node, False))
+            stack.append((right, node, True))
+        return root
+
+    def overlapping(self, start: float, end: float) -> List[T]:
+        """Find the items whose intervals overlap the span from start to
+        end, inclusive, in the order they were given to the index"""
+        return [self.items[position] for position in self.positions(start, end)]
+
+    def positions(self, start: float, end: float) -> List[int]:
+        """Find the positions of the items whose intervals overlap
+        the span from start to end, inclusive, in order"""
+        positions: List[int] = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            if end < node.center:
+                # every interval here ends after the span starts
+                count = bisect_right(node.starts, end)
+                positions.extend(node.start_positions[:count])
+                stack.append(node.left)
+            elif start > node.center:
+                # every interval here starts before the span ends
+                first = bisect_left(node.ends, start)
+                positions.extend(node.end_positions[first:])
+                stack.append(node.right)
+            else:
+                positions.extend(node.start_positions)
+                stack.append(node.left)
+                stack.append(node.right)
+        positions.sort()
+        return positions
+
+
+class AliveDelta(NamedTuple):
+    """The changes to the items which are valid as a time span moves"""
+
+    # items which became valid, in the order they were given to the index
+    added: List[Any]
+    # items which are no longer valid
+    removed: List[Any]
+    # whether the set was rebuilt, in which case added holds every valid item
+    reset: bool
+
+
+class AliveSet(Generic[T]):  # pylint: disable=too-few-public-methods
+    """
+    Tracks the items of an interval index which are valid during a time span
+    as the span moves. The start and end times of the items are kept in
+    sorted order, so that moving the span only visits the items which start
+    or end between its old and new bounds, rather than every valid item.
+    """
+
+    def __init__(self, index: IntervalIndex[T]):
+        self.index = index
+        by_start = sorted(
+            range(len(index)), key=lambda position: index.spans[position][0]
+        )
+        self._starts = [index.spans[position][0] for position in by_start]
+        self._start_positions = by_start
+        by_end = sorted(
+            range(len(index)), key=lambda position: index.spans[position][1]
+        )
+        self._ends = [index.spans[position][1] for position in by_end]
+        self._end_positions = by_end
+        self._alive: Set[int] = set()
+        self._span: Optional[Tuple[float, float]] = None
+
+    def move(self, start: float, end: float) -> AliveDelta:
+        """Move the tracked span, returning the items which became valid
+        and the items which stopped being valid"""
+        items = self.index.items
+        if self._span is None:
+            positions = self.index.positions(start, end)
+            self._alive = set(positions)
+            self._span = (start, end)
+            return AliveDelta([items[position] for position in positions], [], True)
+
+        candidates = self._candidates(start, end)
+        self._span = (start, end)
+
+        added = []
+        removed = []
+        for position in sorted(candidates):
+            span_start, span_end = self.index.spans[position]
+            valid = span_start <= end and span_end >= start
+            if valid and position not in self._alive:
+                self._alive.add(position)
+                added.append(items[position])
+            elif not valid and position in self._alive:
+                self._alive.remove(position)
+                removed.append(items[position])
+        return AliveDelta(added, removed, False)
+
+    def _candidates(self, start: float, end: float) -> Set[int]:
+        """Find the items which may have started or stopped being valid
+        as the span moves: only items which start between the old and new
+        end of the span, or which end between the old and new start"""
+        old_start, old_end = self._span  # type: ignore
+        low, high = min(old_end, end), max(old_end, end)
+        candidates = set(
+            self._start_positions[
+                bisect_left(self._starts, low) : bisect_right(self._starts, high)
+            ]
+        )
+        low, high = min(old_start, start), max(old_start, start)
+        candidates.update(
+            self._end_positions[
+                bisect_left(self._ends, low) : bisect_right(self._ends, high)
+            ]
+        )
+        return candidates
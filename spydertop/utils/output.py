@@ -0,0 +1,105 @@
+#
+# output.py
+#
+# Author: Griffith Thomas
+# Copyright 2022 Spyderbat, Inc. All rights reserved.
+#
+
+"""
+Writing of loaded records to the output file on a background thread, so
+that saving records, and compressing them, does not hold up loading.
+"""
+
+import gzip
+import io
+import queue
+import threading
+from typing import Any, IO, List, Optional, Union
+
+from spydertop.utils import log
+from spydertop.utils.capture import CAPTURE_SUFFIX, CaptureWriter
+
+# the number of batches of lines which can be waiting to be written
+QUEUE_BATCHES = 64
+
+
+class OutputWriter:
+    """
+    Writes batches of lines to an output on a background thread. Batches
+    are passed through a bounded queue, so loading slows down to match the
+    writer rather than holding an unbounded amount of data in memory.
+
+    The output is a binary file, a text file, or a capture writer. Each
+    non-empty line is written with a single trailing newline, so records
+    from separate loads are never joined together.
+    """
+
+    name: str
+
+    def __init__(self, output: Union[IO, CaptureWriter]):
+        self.name = getattr(output, "name", "")
+        self._output = output
+        self._queue: "queue.Queue[Optional[List[Union[str, bytes]]]]" = queue.Queue(
+            maxsize=QUEUE_BATCHES
+        )
+        self._failed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def open(output: Any) -> "OutputWriter":
+        """Create a writer for an output file from the command line. Files
+        ending in .gz are gzipped, and captures are written as captures"""
+        name = getattr(output, "name", "")
+        if name.endswith(".gz"):
+            return OutputWriter(gzip.open(name, "wb"))
+        if name.endswith(CAPTURE_SUFFIX):
+            return OutputWriter(CaptureWriter.open(name))
+        if name in ("", "-", "<stdout>"):
+            return OutputWriter(output)
+        return OutputWriter(open(name, "wb"))  # pylint: disable=consider-using-with
+
+    def write_lines(self, lines: List[Union[str, bytes]]) -> None:
+        """Queue a batch of lines to be written, waiting if the queue is full"""
+        if not self._failed:
+            self._queue.put(lines)
+
+    def _run(self) -> None:
+        while True:
+            lines = self._queue.get()
+            if lines is None:
+                return
+            if self._failed:
+                continue
+            try:
+                self._write(lines)
+            except Exception as exc:  # pylint: disable=broad-except
+                # loading continues without saving records
+                log.err(f"Failed to write to the output file {self.name}: {exc}")
+                log.traceback(exc)
+                self._failed = True
+
+    def _write(self, lines: List[Union[str, bytes]]) -> None:
+        output = self._output
+        records = [
+            line if isinstance(line, bytes) else line.encode("utf-8")
+            for line in lines
+            if line.strip()
+        ]
+        if isinstance(output, CaptureWriter):
+            for record in records:
+                output.write_record(record)
+        elif isinstance(output, io.TextIOBase):
+            output.write(
+                "".join(record.decode("utf-8").rstrip() + "\n" for record in records)
+            )
+        else:
+            output.write(b"".join(record.rstrip() + b"\n" for record in records))
+
+    def close(self) -> None:
+        """Write any queued lines, then close the output"""
+        if not self._thread.is_alive():
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._output.close()
@@ -0,0 +1,115 @@
+#
+# resources.py
+#
+# Author: Griffith Thomas
+# Copyright 2022 Spyderbat, Inc. All rights reserved.
+#
+
+"""
+Columnar storage of the per-process resource usage in event_top_data
+records, which is read for every process row on every update.
+"""
+
+from array import array
+from math import isnan, nan
+from typing import Any, Dict, List, Optional
+
+# the numeric fields of each process in an event_top_data record
+RESOURCE_FIELDS = [
+    "utime",
+    "stime",
+    "cutime",
+    "cstime",
+    "rss",
+    "vsize",
+    "shared",
+    "priority",
+    "nice",
+    "start_time",
+]
+
+
+def _to_float(value: Any) -> float:
+    """A value as a float, or NaN if it is missing or not a number"""
+    return float(value) if isinstance(value, (int, float)) else nan
+
+
+class ResourceTable:
+    """
+    The resource usage of the processes in a single event_top_data record,
+    stored as one array per field, with a row for each PID. The defaults
+    in the record are applied once, when the table is built; values which
+    are missing from both the process and the defaults, or which are not
+    numbers, are stored as NaN.
+    """
+
+    pids: Dict[int, int]
+    columns: Dict[str, "array[float]"]
+    states: List[Optional[str]]
+
+    def __init__(self, processes: Dict[str, Dict[str, Any]]):
+        defaults = processes.get("default")
+        if not isinstance(defaults, dict):
+            defaults = {}
+        # processes with a malformed PID or usage are left out
+        rows = [
+            (int(pid), values)
+            for pid, values in processes.items()
+            if pid.isdigit() and isinstance(values, dict)
+        ]
+        self.pids = {pid: row for row, (pid, _) in enumerate(rows)}
+        self.columns = {
+            field: array(
+                "d",
+                (
+                    _to_float(values.get(field, defaults.get(field)))
+                    for _, values in rows
+                ),
+            )
+            for field in RESOURCE_FIELDS
+        }
+        self.states = [values.get("state", defaults.get("state")) for _, values in rows]
+
+    def __len__(self) -> int:
+        return len(self.pids)
+
+    def __contains__(self, pid: int) -> bool:
+        return pid in self.pids
+
+    def get(self, pid: int, field: str) -> Optional[float]:
+        """The value of a field for a process, or None if it is missing"""
+        row = self.pids.get(pid)
+        if row is None:
+            return None
+        value = self.columns[field][row]
+        return None if isnan(value) else value
+
+    def get_column(self, pids: List[int], field: str) -> List[Optional[float]]:
+        """The values of a field for each of the processes, with None
+        for missing values"""
+        rows = self.pids
+        column = self.columns[field]
+        values: List[Optional[float]] = []
+        for pid in pids:
+            row = rows.get(pid)
+            value = column[row] if row is not None else nan
+            values.append(None if isnan(value) else value)
+        return values
+
+    def state(self, pid: int) -> Optional[str]:
+        """The state of a process, or None if it is missing"""
+        row = self.pids.get(pid)
+        return self.states[row] if row is not None else None
+
+    def record(self, pid: int) -> Optional[Dict[str, Any]]:
+        """The resource usage of a process as a dictionary of its fields and
+        its state, with None for missing values, or None if it is missing"""
+        row = self.pids.get(pid)
+        if row is None:
+            return None
+        record: Dict[str, Any] = {
+            field: None if isnan(column[row]) else column[row]
+            for field, column in self.columns.items()
+        }
+        record["state"] = self.states[row]
+        return record
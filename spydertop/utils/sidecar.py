@@ -0,0 +1,264 @@
+#
+# sidecar.py
+#
+# Author: Griffith Thomas
+# Copyright 2022 Spyderbat, Inc. All rights reserved.
+#
+
+"""
+Time indexes for JSON-lines input files, saved as sidecar files under
+~/.spyderbat-api/indexes rather than next to the input, which is never
+written to. The index is built the first time a file is read in full,
+after which the file can be opened at any time, reading only the records
+around that time.
+
+Offsets in the index are in decompressed bytes, so gzipped files are still
+decompressed up to the records needed, but the records which are skipped
+are never decoded.
+"""
+
+import gzip
+import hashlib
+import json
+import math
+import os
+import tempfile
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from spydertop.utils import log
+from spydertop.utils.capture import CaptureBlock, record_span
+from spydertop.utils.stream import LineStream, WindowedFile
+
+SIDECAR_SUFFIX = ".spyderidx"
+SIDECAR_VERSION = 1
+
+# the number of bytes of records covered by each index entry
+BLOCK_BYTES = 256 * 1024
+
+
+def default_index_dir() -> str:
+    """The location of the sidecar indexes, under $HOME/.spyderbat-api"""
+    return os.path.join(
+        os.environ.get("HOME", ""), ".spyderbat-api", "indexes"  # type: ignore
+    )
+
+
+def sidecar_path(path: str) -> str:
+    """The location of the sidecar index for an input file, named by its
+    absolute path. The index records the size and modification time of
+    the file, so an index for an older version of the file is not used"""
+    digest = hashlib.sha1(os.path.realpath(path).encode("utf-8")).hexdigest()
+    return os.path.join(default_index_dir(), digest + SIDECAR_SUFFIX)
+
+
+def _file_stamp(path: str) -> Tuple[int, int]:
+    """The size and modification time of a file, which identify its version"""
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+class SidecarBuilder:  # pylint: disable=too-few-public-methods
+    """
+    Builds the index for an input file from its lines as they are read.
+    Records which are valid indefinitely are indexed individually, as
+    they are needed for any later time; the rest are indexed in blocks.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._offset = 0
+        self._blocks: List[CaptureBlock] = []
+        self._open_ranges: List[List[float]] = []
+        # the block currently being built
+        self._block_offset = 0
+        self._block_count = 0
+        self._block_spans: Dict[str, Tuple[float, float]] = {}
+
+    def observe(self, lines: Iterable[bytes]) -> Iterator[bytes]:
+        """Pass through the lines of the file, writing the index
+        once they have all been read"""
+        for line in lines:
+            self._add(line)
+            yield line
+        self._end_block()
+        self._write()
+
+    def _add(self, line: bytes) -> None:
+        offset = self._offset
+        self._offset += len(line) + 1
+        self._block_count += 1
+
+        if line.strip():
+            short_schema, start, end = record_span(line.rstrip())
+            spans = self._block_spans
+            if end == math.inf:
+                self._add_open_range(offset, len(line) + 1, start)
+            elif short_schema in spans:
+                span_start, span_end = spans[short_schema]
+                spans[short_schema] = (min(span_start, start), max(span_end, end))
+            else:
+                spans[short_schema] = (start, end)
+
+        if self._offset - self._block_offset >= BLOCK_BYTES:
+            self._end_block()
+
+    def _end_block(self) -> None:
+        if self._block_count > 0:
+            self._blocks.append(
+                CaptureBlock(
+                    self._block_offset,
+                    self._offset - self._block_offset,
+                    self._block_count,
+                    self._block_spans,
+                )
+            )
+        self._block_offset = self._offset
+        self._block_count = 0
+        self._block_spans = {}
+
+    def _add_open_range(self, offset: int, length: int, start: float) -> None:
+        """Index a record which is valid indefinitely, joining it
+        to the previous one if they are next to each other"""
+        if self._open_ranges:
+            last = self._open_ranges[-1]
+            if last[0] + last[1] == offset:
+                last[1] += length
+                last[2] = min(last[2], start)
+                return
+        self._open_ranges.append([offset, length, start])
+
+    def _write(self) -> None:
+        """Save the index, replacing any index for an older version of the
+        file. It is written to a temporary file first, so that the index
+        is never read while it is partly written"""
+        path = sidecar_path(self.path)
+        temp_path = None
+        try:
+            size, mtime = _file_stamp(self.path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            handle, temp_path = tempfile.mkstemp(
+                dir=os.path.dirname(path), suffix=".tmp"
+            )
+            with os.fdopen(handle, "wb") as raw, gzip.open(
+                raw, "wt", encoding="utf-8"
+            ) as file:
+                json.dump(
+                    {
+                        "version": SIDECAR_VERSION,
+                        "path": os.path.realpath(self.path),
+                        "size": size,
+                        "mtime": mtime,
+                        "blocks": self._blocks,
+                        "open": self._open_ranges,
+                    },
+                    file,
+                )
+            os.replace(temp_path, path)
+            log.info(f"Saved a time index for {self.path} in {path}")
+        except OSError as exc:
+            log.info(f"Unable to save a time index for {self.path}: {exc}")
+            if temp_path is not None and os.path.exists(temp_path):
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+
+
+class IndexedFile(WindowedFile):
+    """
+    A JSON-lines input file, optionally gzipped, which is read
+    one time span at a time using its sidecar index.
+    """
+
+    name: str
+    blocks: List[CaptureBlock]
+
+    def __init__(self, path: str, compressed: bool, index: dict):
+        self.name = path
+        self._compressed = compressed
+        self.blocks = [CaptureBlock.from_json(entry) for entry in index["blocks"]]
+        self._open_ranges: List[Tuple[int, int, float]] = [
+            tuple(entry) for entry in index["open"]  # type: ignore
+        ]
+
+    @staticmethod
+    def open(path: str, compressed: bool) -> Optional["IndexedFile"]:
+        """Open an input file using its sidecar index, if it has an index which
+        is up to date. Returns None if the file must be read in full"""
+        # this is called while parsing arguments, before logging is set up
+        try:
+            with gzip.open(sidecar_path(path), "rt", encoding="utf-8") as file:
+                index = json.load(file)
+            if index.get("version") != SIDECAR_VERSION or [
+                index.get("path"),
+                index.get("size"),
+                index.get("mtime"),
+            ] != [os.path.realpath(path), *_file_stamp(path)]:
+                return None
+            return IndexedFile(path, compressed, index)
+        except (OSError, EOFError, ValueError, KeyError, TypeError):
+            return None
+
+    def start_time(self, schema_prefix: str = "") -> Optional[float]:
+        """The earliest time at which a record with a short schema
+        starting with schema_prefix is valid in the file"""
+        starts = [
+            span[0]
+            for block in self.blocks
+            for schema, span in block.spans.items()
+            if schema.startswith(schema_prefix)
+        ]
+        if "model_".startswith(schema_prefix) or schema_prefix.startswith("model_"):
+            starts.extend(start for _, _, start in self._open_ranges)
+        return min(starts, default=None)
+
+    def _ranges(self, start: float, end: float) -> List[Tuple[int, int]]:
+        """Find the byte ranges of the records valid during a time span,
+        joining ranges which overlap or are next to each other"""
+        ranges = sorted(
+            [
+                (block.offset, block.length)
+                for block in self.blocks
+                if block.overlaps(start, end)
+            ]
+            + [
+                (offset, length)
+                for offset, length, open_start in self._open_ranges
+                if open_start <= end
+            ]
+        )
+        joined: List[Tuple[int, int]] = []
+        for offset, length in ranges:
+            if joined and joined[-1][0] + joined[-1][1] >= offset:
+                last_offset, last_length = joined[-1]
+                joined[-1] = (
+                    last_offset,
+                    max(last_length, offset + length - last_offset),
+                )
+            else:
+                joined.append((offset, length))
+        return joined
+
+    def stream(self, start: float, end: float) -> LineStream:
+        """Read the records which are valid during a time span. Progress is
+        measured in the bytes of the records read"""
+        ranges = self._ranges(start, end)
+        position = [0]
+
+        def chunks() -> Iterator[bytes]:
+            opener = gzip.open if self._compressed else open
+            with opener(self.name, "rb") as file:  # type: ignore
+                for offset, length in ranges:
+                    # gzip files are decompressed up to the offset, but
+                    # the records before it are not decoded
+                    file.seek(offset)
+                    data = file.read(length)
+                    position[0] += length
+                    yield data if data.endswith(b"\n") else data + b"\n"
+
+        return LineStream(
+            chunks(), lambda: position[0], sum(length for _, length in ranges)
+        )
+
+    def close(self) -> None:
+        """Files are only opened while they are being read, so there is nothing to close"""
@@ -0,0 +1,247 @@
+#
+# stream.py
+#
+# Author: Griffith Thomas
+# Copyright 2022 Spyderbat, Inc. All rights reserved.
+#
+
+"""
+Streaming line readers for record input, which split files, gzip files,
+and chunked HTTP responses into lines while tracking the bytes consumed,
+and read several of these streams concurrently.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import gzip
+import os
+import queue
+import threading
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    IO,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+# the number of bytes read from the underlying source at a time
+CHUNK_SIZE = 64 * 1024
+# the number of chunks which can be waiting to be processed
+# when reading from several streams at once
+QUEUE_BATCHES = 64
+
+
+class LineStream:
+    """
+    Iterates over the lines of a stream of byte chunks. Only a single
+    chunk and any partial line are held in memory at a time, so records
+    can be processed as they arrive.
+
+    The number of bytes read from the underlying source is available
+    as `consumed`, and the size of the source, if known, as `total`.
+    For compressed sources, both are measured in compressed bytes.
+    """
+
+    consumed: int = 0
+    total: Optional[int] = None
+
+    def __init__(
+        self,
+        chunks: Iterable[bytes],
+        position: Callable[[], int],
+        total: Optional[int] = None,
+    ):
+        self._chunks = chunks
+        self._position = position
+        self.total = total
+        self.consumed = position()
+
+    @staticmethod
+    def from_file(source: IO) -> "LineStream":
+        """Create a line stream from a text, binary, or gzip file object"""
+        # text files are read through their binary buffer, which avoids
+        # decoding lines that are passed directly to the json parser
+        raw = getattr(source, "buffer", source)
+        underlying = raw.fileobj if isinstance(raw, gzip.GzipFile) else raw
+        try:
+            total: Optional[int] = os.fstat(underlying.fileno()).st_size
+        except (AttributeError, OSError):
+            total = None
+        return LineStream(
+            iter(lambda: raw.read(CHUNK_SIZE), b""), underlying.tell, total
+        )
+
+    @staticmethod
+    def from_response(response: Any) -> "LineStream":
+        """Create a line stream from an unloaded urllib3 HTTP response"""
+        length = response.headers.get("content-length")
+        return LineStream(
+            response.stream(CHUNK_SIZE),
+            response.tell,
+            int(length) if length is not None else None,
+        )
+
+    @staticmethod
+    def concat(streams: List["LineStream"]) -> "LineStream":
+        """Join several line streams into a single stream, reading each in turn"""
+
+        # pylint: disable=protected-access
+        def chunks() -> Iterator[bytes]:
+            for stream in streams:
+                yield from stream._chunks
+                # keep the last line of each stream separate
+                yield b"\n"
+
+        totals = [stream.total for stream in streams]
+        return LineStream(
+            chunks(),
+            lambda: sum(stream._position() for stream in streams),
+            None if None in totals else sum(totals),  # type: ignore
+        )
+
+    def tee(
+        self, write: Callable[[bytes], None], close: Callable[[bool], None]
+    ) -> "LineStream":
+        """
+        Create a stream over the same source which passes each chunk to write
+        as it is read. Once reading stops, close is called with whether the
+        source was read to the end. If the stream is never read, neither is called.
+        """
+
+        def chunks() -> Iterator[bytes]:
+            completed = False
+            try:
+                for chunk in self._chunks:
+                    write(chunk)
+                    yield chunk
+                completed = True
+            finally:
+                close(completed)
+
+        return LineStream(chunks(), self._position, self.total)
+
+    @property
+    def exhausted(self) -> bool:
+        """Whether the underlying source has already been read to the end"""
+        return self.total is not None and self.consumed >= self.total
+
+    def batches(self) -> Iterator[List[bytes]]:
+        """Iterate over the lines in batches, one batch per chunk read"""
+        remainder = b""
+        for chunk in self._chunks:
+            lines = (remainder + chunk).split(b"\n")
+            remainder = lines.pop()
+            self.consumed = self._position()
+            yield lines
+        self.consumed = self._position()
+        if remainder:
+            yield [remainder]
+
+    def __iter__(self) -> Iterator[bytes]:
+        for batch in self.batches():
+            yield from batch
+
+
+class WindowedFile:
+    """
+    A file input which can be read one time span at a time, rather
+    than all at once, in the same way as data is fetched from the API.
+    """
+
+    name: str
+
+    def start_time(self, schema_prefix: str = "") -> Optional[float]:
+        """The earliest time at which a record with a short schema
+        starting with schema_prefix is valid in the file"""
+        raise NotImplementedError
+
+    def stream(self, start: float, end: float) -> LineStream:
+        """Read the records which are valid during a time span"""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Close the underlying file"""
+        raise NotImplementedError
+
+
+class ConcurrentLines:  # pylint: disable=too-few-public-methods
+    """
+    Reads several line streams concurrently on a bounded pool of threads,
+    yielding lines from each stream as they arrive. Streams are opened by
+    the worker threads, so slow requests do not hold up each other.
+
+    Lines are passed from the workers through a bounded queue, so memory
+    stays bounded if lines arrive faster than they are consumed. A stream
+    which fails does not interrupt the others; its exception is saved in
+    `failures` under its key.
+    """
+
+    failures: Dict[Hashable, Exception]
+    completed: List[Hashable]
+
+    def __init__(
+        self,
+        sources: Dict[Hashable, Callable[[], Optional[LineStream]]],
+        workers: int,
+        on_complete: Optional[Callable[[Hashable], None]] = None,
+    ):
+        self._sources = sources
+        self._workers = max(min(workers, len(sources)), 1)
+        self._on_complete = on_complete
+        self._queue: "queue.Queue[Tuple[Hashable, Optional[List[bytes]]]]" = (
+            queue.Queue(maxsize=QUEUE_BATCHES)
+        )
+        self._cancelled = threading.Event()
+        self.failures = {}
+        self.completed = []
+
+    def _put(self, item: Tuple[Hashable, Optional[List[bytes]]]) -> bool:
+        """Put an item on the queue, giving up if the reader has stopped"""
+        while not self._cancelled.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _read(self, key: Hashable) -> None:
+        """Read a single stream onto the queue, finishing with a None batch"""
+        try:
+            stream = self._sources[key]()
+            if stream is not None:
+                for batch in stream.batches():
+                    if not self._put((key, batch)):
+                        return
+        except Exception as exc:  # pylint: disable=broad-except
+            self.failures[key] = exc
+        finally:
+            self._put((key, None))
+
+    def __iter__(self) -> Iterator[bytes]:
+        if len(self._sources) == 0:
+            return
+        pool = ThreadPoolExecutor(self._workers)
+        try:
+            for key in self._sources:
+                pool.submit(self._read, key)
+            remaining = len(self._sources)
+            while remaining > 0:
+                key, batch = self._queue.get()
+                if batch is None:
+                    remaining -= 1
+                    if key not in self.failures:
+                        self.completed.append(key)
+                        if self._on_complete is not None:
+                            self._on_complete(key)
+                    continue
+                yield from batch
+        finally:
+            # stop the workers if the reader finished early
+            self._cancelled.set()
+            pool.shutdown(wait=False)
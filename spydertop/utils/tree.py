@@ -0,0 +1,123 @@
+#
+# tree.py
+#
+# Author: Griffith Thomas
+# Copyright 2022 Spyderbat, Inc. All rights reserved.
+#
+
+"""
+The tree of processes by their parents, which is kept up to date as
+processes are loaded rather than being rebuilt.
+"""
+
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from spydertop.utils import log
+from spydertop.utils.types import Record, Tree
+
+# processes which are always shown at the root of the tree:
+# the init process and kthreadd
+ROOT_PIDS = {1, 2}
+
+
+class ProcessTree:
+    """
+    Maintains the tree of processes in the nested format of AppModel.tree,
+    where each process maps to None if it has no children, or to a tuple of
+    whether it is expanded and its children. Adding a process only visits
+    the process and the processes waiting for it, and never recurses, so
+    the depth of the tree is not limited.
+
+    Processes whose parent is not loaded are placed at the root of the
+    tree, and are moved under their parent if it is loaded later. The
+    expanded state of existing branches is kept as processes are added.
+    """
+
+    root: Tree
+    # the parent of each process in the tree, or None for roots
+    parents: Dict[str, Optional[str]]
+
+    def __init__(self, expanded: bool):
+        self.root = {}  # type: ignore
+        self.parents = {}
+        self.expanded = expanded
+        # the children of each process which has children
+        self._children: Dict[str, Tree] = {}
+        # roots waiting for their parent to be loaded, by the parent's id
+        self._waiting: Dict[str, Set[str]] = {}
+
+    def __contains__(self, rec_id: str) -> bool:
+        return rec_id in self.parents
+
+    def add(self, processes: Iterable[Record]) -> None:
+        """Add processes to the tree, ignoring those already in it"""
+        for proc in processes:
+            try:
+                rec_id = proc["id"]
+                if rec_id in self.parents:
+                    continue
+                parent_id = proc["ppuid"] if proc["pid"] not in ROOT_PIDS else None
+            except KeyError as exc:
+                log.err(f"Process {exc} is missing.")
+                log.traceback(exc)
+                continue
+            self._add(rec_id, parent_id)
+
+    def _add(self, rec_id: str, parent_id: Optional[str]) -> None:
+        if parent_id is not None and parent_id not in self.parents:
+            # the parent is not loaded yet
+            self._waiting.setdefault(parent_id, set()).add(rec_id)
+            parent_id = None
+        self.parents[rec_id] = parent_id
+        self._children_of(parent_id)[rec_id] = None
+
+        # adopt the processes which were waiting for this one
+        for child_id in self._waiting.pop(rec_id, set()):
+            if child_id not in self.ancestors(rec_id):
+                self._move(child_id, rec_id)
+
+    def _move(self, rec_id: str, parent_id: str) -> None:
+        """Move a process and its children under a new parent"""
+        branch = self._children_of(self.parents[rec_id]).pop(rec_id)
+        if branch is not None:
+            # it is no longer a root, so it is no longer always expanded
+            branch = (self.expanded, branch[1])
+        self.parents[rec_id] = parent_id
+        self._children_of(parent_id)[rec_id] = branch
+
+    def _children_of(self, rec_id: Optional[str]) -> Tree:
+        """The mapping of a process's children, which is
+        created if the process did not have any"""
+        if rec_id is None:
+            return self.root
+        children = self._children.get(rec_id)
+        if children is None:
+            parent_id = self.parents[rec_id]
+            children = {}  # type: ignore
+            # root processes are always expanded
+            expanded = self.expanded or parent_id is None
+            self._children_of(parent_id)[rec_id] = (expanded, children)
+            self._children[rec_id] = children
+        return children
+
+    def toggle(self, rec_id: str) -> Optional[Tuple[bool, Tree]]:
+        """Expand or collapse the branch of a process, returning the new
+        branch, or None if the process has no children. Only the process
+        is visited, as it is found by the parent index."""
+        if rec_id not in self.parents:
+            return None
+        siblings = self._children_of(self.parents[rec_id])
+        branch = siblings[rec_id]
+        if branch is None:
+            return None
+        siblings[rec_id] = branch = (not branch[0], branch[1])
+        return branch
+
+    def ancestors(self, rec_id: str) -> List[str]:
+        """The ids of a process and its ancestors, from the process upwards"""
+        ancestors = []
+        current: Optional[str] = rec_id
+        while current is not None:
+            ancestors.append(current)
+            current = self.parents.get(current)
+        return ancestors
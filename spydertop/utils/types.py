@@ -10,7 +10,7 @@ Custom or modified types for use in the application.
 """
 
 import bisect
-from enum import Enum
+from enum import Enum, Flag
 import re
 from textwrap import TextWrapper
 import traceback
@@ -78,6 +78,23 @@ class Alignment(Enum):
         return self.value
 
 
+class Dependency(Flag):
+    """What the cells of a column depend on, other than their record,
+    so that cells are only recalculated when needed"""
+
+    # the cells only change when the record does
+    RECORD = 0
+    # the current time
+    TIME = 1
+    # the current and previous event_top_data records
+    RESOURCES = 2
+    # the timezone that times are shown in
+    TIMEZONE = 4
+    # other loaded records, such as the containers, sessions, and machine
+    RELATED = 8
+    ALL = TIME | RESOURCES | TIMEZONE | RELATED
+
+
 class Status(Enum):
     """The status of a process"""
 
@@ -425,6 +442,37 @@ class TimeSpanTracker:
         # if the index is odd, then it is in the middle of a time span
         return index % 2 == 1 or time in self.times
 
+    def span_end(self, time: float) -> Optional[float]:
+        """Return the end of the time span containing the given time,
+        or None if the time has not been loaded."""
+        index = bisect.bisect_right(self.times, time)
+        if index % 2 == 1:
+            return self.times[index]
+        # the time is exactly the end of a time span
+        if index > 0 and self.times[index - 1] == time:
+            return time
+        return None
+
+    def gaps(self, start: float, end: float) -> List[Tuple[float, float]]:
+        """Return the parts of the time span from start to end which have
+        not been loaded, in order."""
+        gaps = []
+        current = start
+        index = bisect.bisect_right(self.times, start)
+        if index % 2 == 1:
+            # the start time is in the middle of a time span
+            current = self.times[index]
+            index += 1
+        while current < end:
+            if index >= len(self.times) or self.times[index] >= end:
+                gaps.append((current, end))
+                break
+            if self.times[index] > current:
+                gaps.append((current, self.times[index]))
+            current = self.times[index + 1]
+            index += 2
+        return gaps
+
     def __str__(self) -> str:
         return "".join(
             [
@@ -10,8 +10,22 @@ This module contains a table widget which displays data in a tabular format.
 It extends the functionality of the asciimatics.widgets.MultiColumnListBox
 """
 
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from operator import itemgetter
 import re
-from typing import Any, Dict, List, NewType, Optional, Tuple, Union
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    NewType,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
 from asciimatics.screen import Screen
 from asciimatics.event import KeyboardEvent, MouseEvent
@@ -20,12 +34,90 @@ from asciimatics.parsers import Parser
 from asciimatics.strings import ColouredText
 from spydertop.constants.columns import Column
 
-from spydertop.utils.types import Alignment, ExtendedParser
+from spydertop.utils.filters import ColumnIndexes, RowFilter
+from spydertop.utils.types import Alignment, ExtendedParser, Record
 from spydertop.constants import COLOR_REGEX
 from spydertop.model import AppModel, Tree
 from spydertop.config import Config
 
-InternalRow = NewType("InternalRow", Tuple[List[Union[ColouredText, str]], List[Any]])
+InternalRow = NewType(
+    "InternalRow", Tuple[Sequence[Union[ColouredText, str]], List[Any]]
+)
+# whether each ancestor of a row in the tree is the last of its siblings,
+# whether the row cannot be expanded, and whether it is the last of its siblings
+TreeShape = Tuple[Tuple[bool, ...], bool, bool]
+
+# the number of formatted cells kept for painting and filtering the table
+CELL_CACHE_SIZE = 4096
+# the number of compiled filters kept, such as those for each
+# search string as a search is typed
+FILTER_CACHE_SIZE = 16
+
+
+class CellCache:
+    """
+    Formats the cells of the rows built from the same columns and model
+    state, keeping the most recently used cells. Cells are only formatted
+    when they are displayed or matched against, so the cost of formatting
+    depends on the height of the table rather than the number of rows.
+    """
+
+    def __init__(
+        self, model: AppModel, columns: List[Column], size: int = CELL_CACHE_SIZE
+    ):
+        self.model = model
+        self.columns = columns
+        self.size = size
+        # the record is kept with its cells so that its id is not reused
+        self._cells: "OrderedDict[Tuple[int, int, int], Tuple[Record, str]]" = (
+            OrderedDict()
+        )
+        # cells from before a column was invalidated are never used again,
+        # and are dropped as newer cells are added
+        self._generations = [0] * len(columns)
+
+    def format(self, record: Record, values: List[Any], index: int) -> str:
+        """Format a cell of the row for a record"""
+        key = (id(record), index, self._generations[index])
+        cached = self._cells.get(key)
+        if cached is not None:
+            self._cells.move_to_end(key)
+            return cached[1]
+
+        text = self.columns[index].format_value(self.model, record, values[index])
+        self._cells[key] = (record, text)
+        if len(self._cells) > self.size:
+            self._cells.popitem(last=False)
+        return text
+
+    def invalidate(self, index: int) -> None:
+        """Stop using the formatted cells of a column, after its
+        values have been recalculated"""
+        self._generations[index] += 1
+
+
+class LazyRow(Sequence[str]):
+    """
+    The displayable cells of a row, which are formatted by a cell
+    cache when they are accessed.
+    """
+
+    __slots__ = ("cache", "record", "values")
+
+    def __init__(self, cache: CellCache, record: Record, values: List[Any]):
+        self.cache = cache
+        self.record = record
+        self.values = values
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __getitem__(self, index):  # type: ignore
+        if isinstance(index, slice):
+            return [self[i] for i in range(len(self.values))[index]]
+        if index < 0:
+            index += len(self.values)
+        return self.cache.format(self.record, self.values, index)
 
 
 class Table(Widget):  # pylint: disable=too-many-instance-attributes
@@ -40,6 +132,34 @@ class Table(Widget):  # pylint: disable=too-many-instance-attributes
     _rows: List[InternalRow] = []
     _filtered_rows: List[InternalRow] = []
     _tree_rows: Optional[List[InternalRow]] = None
+    # the rows shown in the tree, by their id
+    _tree_by_id: Dict[str, InternalRow] = {}
+    # the shape of the branches before each row of the tree, by its id
+    _tree_shapes: Dict[str, TreeShape] = {}
+    # the signature and sorted ids of the children of each level
+    # of the tree, by the id of their parent
+    _tree_levels: Dict[Optional[str], Tuple[Tuple, List[str]]] = {}
+    _tree_sorted_by: Optional[Tuple] = None
+    # the parent of each row of the tree and the number of rows under it,
+    # and the number of those which match the filter, by its id. These are
+    # counted the first time a branch is toggled after the rows change
+    _tree_parents: Dict[str, Optional[str]] = {}
+    _tree_sizes: Optional[Dict[str, int]] = None
+    _tree_filtered_sizes: Optional[Dict[str, int]] = None
+    # the filters compiled for the current rows, by their string
+    # and which columns are enabled
+    _filters: "OrderedDict[Tuple[str, Tuple[bool, ...]], RowFilter]"
+    # the indexes of the values of the current rows, for filtering them
+    _indexes: Optional[ColumnIndexes] = None
+    # the row selected when the search started, and the last search string
+    _search_origin: int = 0
+    _search_text: Optional[str] = None
+    # the last search and the positions of the filtered rows it matched,
+    # and the position of each filtered row by the id of its sortable values
+    _matches: Optional[Tuple[RowFilter, List[int]]] = None
+    _positions: Optional[Dict[int, int]] = None
+    # the rows which were last filtered, and the filter
+    _last_filter: Optional[Tuple[List[InternalRow], RowFilter]] = None
 
     _config: Config
     _parser: Parser
@@ -64,6 +184,10 @@ class Table(Widget):  # pylint: disable=too-many-instance-attributes
         self._parser = parser
         self._config = model.config
         self.tree = tree
+        self._tree_by_id = {}
+        self._tree_shapes = {}
+        self._tree_levels = {}
+        self._filters = OrderedDict()
 
     def update(
         self, frame_no
@@ -120,10 +244,13 @@ class Table(Widget):  # pylint: disable=too-many-instance-attributes
 
         # then, print the rows
         y_offset = 1
+        showing_tree = self._showing_tree()
         for i in range(self._vertical_offset, self._vertical_offset + self._h - 1):
             if i >= len(self._filtered_rows) or i < 0:
                 break
-            displayable_row, _ = self._filtered_rows[i]
+            displayable_row, sortable_row = self._filtered_rows[i]
+            # the branches of the tree are drawn before the last cell
+            prefix = self._tree_prefix(sortable_row[0]) if showing_tree else ""
             x_offset = -self._horizontal_offset
             if self._state["selected_row"] == i:
                 color, attr, background = self._frame.palette.get(
@@ -145,6 +272,8 @@ class Table(Widget):  # pylint: disable=too-many-instance-attributes
                             + self._horizontal_offset
                         )
                     line = str(displayable_row[j]).replace("\n", " ")
+                    if prefix and j == len(self.columns) - 1:
+                        line = prefix + line
                     # first, the space needed to pad the text to the correct alignment
                     # is calculated.
                     extra_space = width - len(re.sub(COLOR_REGEX, "", str(line)))
@@ -263,13 +392,16 @@ class Table(Widget):  # pylint: disable=too-many-instance-attributes
         pass
 
     def set_rows(
-        self, displayable_rows: List[List[str]], sortable_rows: List[List[Any]]
+        self,
+        displayable_rows: Sequence[Sequence[str]],
+        sortable_rows: List[List[Any]],
     ) -> None:
         """
         Set the rows for the table. Both the displayable and sortable rows
         must be in the same order and have the same number of columns and rows.
 
-        :param displayable_rows: a list of lists of strings, each representing a row
+        :param displayable_rows: a list of sequences of strings, such as LazyRows,
+            each representing a row
         :param sortable_rows: a list of lists of sortable data, each representing a row
         """
         assert len(displayable_rows) == len(sortable_rows)
@@ -277,6 +409,9 @@ class Table(Widget):  # pylint: disable=too-many-instance-attributes
             assert len(displayable_rows[0]) == len(sortable_rows[0])
 
         self._rows = list(zip(displayable_rows, sortable_rows))  # type: ignore
+        # the rows may have changed, so they must be matched again
+        self._filters = OrderedDict()
+        self._indexes = ColumnIndexes(self._rows, self.columns)
         self.do_sort()
 
     def do_sort(self) -> None:
@@ -286,7 +421,7 @@ class Table(Widget):  # pylint: disable=too-many-instance-attributes
 
         # if we are displaying a tree, we need to use the tree to sort
         # first, and to modify the command
-        if self._config["tree"] and self._config["tab"] == "processes":
+        if self._showing_tree():
             # we need the columns to have an ID
             assert self.columns[0].header_name == "ID"
             # refactor cached sortable data to be indexed by id
@@ -294,90 +429,67 @@ class Table(Widget):  # pylint: disable=too-many-instance-attributes
             for row in self._rows:
                 sortable[row[1][0]] = row
 
-            self._tree_rows = self._sort_level(self.tree, sortable, 0, [])
+            self._tree_by_id = sortable
+            self._tree_rows = self._flatten_tree(sortable)
         else:
             self._rows = self._simple_sort(self._rows)
+        self._last_filter = None
         self.do_filter()
 
     def do_filter(self) -> None:
         """
         Filter the rows by the configured value.
         """
-        value = self._config["filter"]
         rows = (
             self._tree_rows
-            if self._config["tree"]
-            and self._config["tab"] == "processes"
-            and self._tree_rows is not None
+            if self._showing_tree() and self._tree_rows is not None
             else self._rows
         )
+        self._forget_matches()
+        self._tree_filtered_sizes = None
+        value = self._config["filter"]
+        previous = self._last_filter
+        self._last_filter = None
         if value is None:
             self._filtered_rows = rows
-            return
-
-        column_matches, rest = self._parse_filter(value)
-
-        self._filtered_rows = [
-            row for row in rows if self._filter_predicate(row, column_matches, rest)
-        ]
+        else:
+            row_filter = self._compile_filter(value)
+            if (
+                previous is not None
+                and previous[0] is rows
+                and row_filter.narrows(previous[1])
+            ):
+                # as a filter is typed, only the rows which matched
+                # the start of it need to be checked
+                self._filtered_rows = row_filter.filter(self._filtered_rows)
+            else:
+                self._filtered_rows = row_filter.filter(rows)
+            self._last_filter = (rows, row_filter)
         if self._state["selected_row"] >= len(self._filtered_rows):
             self.value = 0
 
-    def _filter_predicate(  # pylint: disable=too-many-return-statements
-        self, row: InternalRow, column_matches: List[str], rest: str
-    ) -> bool:
-        # filter by specific columns
-        for column_match in column_matches:
-            try:
-                index = [_.header_name.lower() for _ in self.columns].index(
-                    column_match[0].lower()
-                )
-                if index >= len(row[0]):
-                    return False
-                # handle numerical comparisons
-                if column_match[1][0] in {"<", ">"}:
-                    if row[1][index] is None:
-                        return False
-                    if column_match[1][0] == "<":
-                        if row[1][index] >= float(column_match[1][1:]):
-                            return False
-                    elif row[1][index] <= float(column_match[1][1:]):
-                        return False
-                # handle nots
-                elif column_match[1][0] == "!" and column_match[1][1:] in str(
-                    row[0][index]
-                ):
-                    return False
-                # handle case with no operator
-                elif (column_match[1][0] != "!") and not column_match[1] in str(
-                    row[0][index]
-                ):
-                    return False
-            except ValueError:
-                pass
-
-        # match the rest against the entire visible row
-        combined = " ".join(
-            [str(v) for i, v in enumerate(row[0]) if self.columns[i].enabled]
-        )
-
-        if len(rest) > 0 and rest[0] == "!":
-            return rest[1:] not in combined
-
-        return rest in combined
-
-    def _parse_filter(self, value: str) -> Tuple[List[str], str]:
-        """
-        Parse a filter string into a list of tuples of the form (column, value).
-        """
-        column_matches = []
-        match_regex = re.compile(r"\s*(\S+): ?(\S+)( +|$)")
-        match = re.match(match_regex, value)
-        while match:
-            column_matches.append((match.group(1), match.group(2)))
-            value = value[match.end() :]
-            match = re.match(match_regex, value)
-        return column_matches, value.strip()
+    def _filter_rows(self, rows: List[InternalRow]) -> List[InternalRow]:
+        """The rows which match the configured filter, which are
+        the same list of rows if there is no filter"""
+        value = self._config["filter"]
+        if value is None:
+            return rows
+        return self._compile_filter(value).filter(rows)
+
+    def _compile_filter(self, value: str) -> RowFilter:
+        """Compile a filter or search string for the current rows. The
+        filters compiled since the rows were set are reused, along with
+        the rows they matched."""
+        key = (value, tuple(col.enabled for col in self.columns))
+        row_filter = self._filters.get(key)
+        if row_filter is None:
+            row_filter = RowFilter(value, self.columns, self._indexes)
+            self._filters[key] = row_filter
+            if len(self._filters) > FILTER_CACHE_SIZE:
+                self._filters.popitem(last=False)
+        else:
+            self._filters.move_to_end(key)
+        return row_filter
 
     def fix_vert_offset(self):
         """Fix the vertical offset to keep the selected row
@@ -391,14 +503,74 @@ class Table(Widget):  # pylint: disable=too-many-instance-attributes
         if self._state["selected_row"] >= self._vertical_offset + self._h - 1:
             self._vertical_offset = self._state["selected_row"] - self._h + 2
 
+    def start_search(self) -> None:
+        """Starts a new search from the selected row"""
+        self._search_origin = self._state["selected_row"]
+
     def find(self, search: str) -> bool:
-        """Finds the first row that contains the given search string."""
-        column_matches, rest = self._parse_filter(search)
-        for i, row in enumerate(self._filtered_rows):
-            if self._filter_predicate(row, column_matches, rest):
-                self.value = i
-                return True
-        return False
+        """Finds the first row from where the search started which contains
+        the given search string, wrapping around to the top of the table."""
+        self._search_text = search
+        matches = self._find_matches(search)
+        if len(matches) == 0:
+            return False
+        self.value = matches[bisect_left(matches, self._search_origin) % len(matches)]
+        return True
+
+    def find_next(self) -> bool:
+        """Finds the next row after the selected row which contains the
+        last search string, wrapping around to the top of the table."""
+        if self._search_text is None:
+            return False
+        matches = self._find_matches(self._search_text)
+        if len(matches) == 0:
+            return False
+        position = bisect_right(matches, self._state["selected_row"])
+        self.value = matches[position % len(matches)]
+        return True
+
+    def find_previous(self) -> bool:
+        """Finds the previous row before the selected row which contains the
+        last search string, wrapping around to the bottom of the table."""
+        if self._search_text is None:
+            return False
+        matches = self._find_matches(self._search_text)
+        if len(matches) == 0:
+            return False
+        position = bisect_left(matches, self._state["selected_row"]) - 1
+        self.value = matches[position % len(matches)]
+        return True
+
+    def _find_matches(self, search: str) -> List[int]:
+        """The positions of the filtered rows which contain a search string.
+        Only the rows found by the indexes are checked, and as a search is
+        typed, only the rows which matched the start of it are checked."""
+        row_filter = self._compile_filter(search)
+        previous = self._matches
+        if previous is not None and previous[0] is row_filter:
+            return previous[1]
+
+        rows = self._filtered_rows
+        candidates: Sequence[int]
+        if previous is not None and row_filter.narrows(previous[0]):
+            candidates = previous[1]
+        elif row_filter.candidates is not None:
+            if self._positions is None:
+                self._positions = {id(row[1]): i for i, row in enumerate(rows)}
+            positions = self._positions
+            candidates = sorted(
+                positions[key] for key in row_filter.candidates if key in positions
+            )
+        else:
+            candidates = range(len(rows))
+        matches = [i for i in candidates if row_filter(rows[i])]
+        self._matches = (row_filter, matches)
+        return matches
+
+    def _forget_matches(self) -> None:
+        """Forget the rows matched by searches, after the filtered rows change"""
+        self._matches = None
+        self._positions = None
 
     def get_selected(self) -> Optional[InternalRow]:
         """Returns the selected row"""
@@ -409,59 +581,296 @@ class Table(Widget):  # pylint: disable=too-many-instance-attributes
             return None
         return self._filtered_rows[self._state["selected_row"]]
 
-    def _sort_level(
+    def _showing_tree(self) -> bool:
+        """Whether the rows are displayed as the tree of processes"""
+        return self._config["tree"] and self._config["tab"] == "processes"
+
+    def _flatten_tree(self, rows: Dict[str, InternalRow]) -> List[InternalRow]:
+        """Flatten the tree into the rows in the order they are displayed,
+        sorting each level. The sorted order of a level is kept until its
+        children or their sort keys change, and the shape of the branches
+        is recorded so that the prefixes can be drawn as rows are painted."""
+        sorted_by = (
+            self._config["sort_column"],
+            self._config["sort_ascending"],
+            id(self.columns),
+        )
+        if sorted_by != self._tree_sorted_by:
+            self._tree_sorted_by = sorted_by
+            self._tree_levels = {}
+
+        levels: Dict[Optional[str], Tuple[Tuple, List[str]]] = {}
+        shapes: Dict[str, TreeShape] = {}
+        flattened = self._flatten_branch(
+            None,
+            self.tree,
+            (),
+            rows=rows,
+            sort_key=self._sort_key(),
+            levels=levels,
+            shapes=shapes,
+        )
+        # levels which were not visited are dropped
+        self._tree_levels = levels
+        self._tree_shapes = shapes
+        self._tree_sizes = None
+        return flattened
+
+    def _flatten_branch(  # pylint: disable=too-many-arguments,too-many-locals
         self,
-        tree: Dict[str, Any],
-        rows: Dict[str, Tuple],
-        depth: int,
-        parents_end: List[bool],
+        parent_id: Optional[str],
+        tree: Optional[Dict[str, Any]],
+        parents_end: Tuple[bool, ...],
+        *,
+        rows: Dict[str, InternalRow],
+        sort_key: Callable[[List[Any]], Any],
+        levels: Dict[Optional[str], Tuple[Tuple, List[str]]],
+        shapes: Dict[str, TreeShape],
     ) -> List[InternalRow]:
-        """Sort a level of the tree, appending sorted versions
-        of the children underneath each row."""
-        level = []
-
-        # construct a list of all the children of this level
-        for rec_id, branch in tree.items():
-            if rec_id not in rows:
-                # this process is excluded, so don't include it in the tree
-                continue
-            row = rows[rec_id]
-            level.append(row)
-
-        # sort this level
-        level = self._simple_sort(level)
-
-        # recursively build the final rows
-        sorted_rows = []
-        for i, row in enumerate(level):
-            branch = tree[row[1][0]]
-            new_displayable = list(row[0])
-            prefix = self._make_tree_prefix(
-                depth,
-                branch is None
-                or branch[0]
-                or len([x for x in branch[1].keys() if x in rows]) == 0,
-                i == len(level) - 1,
+        """Flatten the rows under a branch of the tree, adding the sorted
+        levels and the shapes of the rows it contains"""
+        flattened = []
+        # the rows left to visit, in reverse order, with the branches of the
+        # tree under them and whether their ancestors are the last siblings.
+        # The tree is walked without recursion, so its depth is not limited
+        stack: List[Tuple[str, Any, Tuple[bool, ...], bool]] = []
+        while True:
+            if tree is not None:
+                # push the sorted children of the row, so that they are next
+                children = self._sort_children(parent_id, tree, rows, sort_key, levels)
+                last = len(children) - 1
+                for i in range(last, -1, -1):
+                    rec_id = children[i]
+                    stack.append((rec_id, tree[rec_id], parents_end, i == last))
+            if not stack:
+                break
+
+            parent_id, branch, parents_end, end = stack.pop()
+            flattened.append(rows[parent_id])  # type: ignore
+            shapes[parent_id] = (  # type: ignore
                 parents_end,
+                self._not_expandable(branch, rows),
+                end,
             )
-            if isinstance(new_displayable[-1], ColouredText):
-                new_displayable[-1] = ColouredText(
-                    prefix + new_displayable[-1].raw_text, self._parser  # type: ignore
-                )
-            else:
-                new_displayable[-1] = prefix + new_displayable[-1]
-            sorted_rows.append((new_displayable, row[1]))
+            tree = None
             if branch is not None and branch[0]:
-                sorted_rows.extend(
-                    self._sort_level(
-                        branch[1],
-                        rows,
-                        depth + 1,
-                        parents_end + [i == len(level) - 1],
-                    )
-                )
+                tree = branch[1]
+                parents_end += (end,)
+        return flattened
+
+    @staticmethod
+    def _not_expandable(branch: Any, rows: Dict[str, InternalRow]) -> bool:
+        """Whether a branch of the tree is expanded or has nothing to expand"""
+        return (
+            branch is None or branch[0] or not any(child in rows for child in branch[1])
+        )
+
+    def toggle_branch(self, rec_id: str, branch: Tuple[bool, Dict[str, Any]]) -> None:
+        """Add or remove the rows under a process after its branch of the
+        tree was expanded or collapsed, without sorting the other rows"""
+        rows = self._tree_rows
+        shape = self._tree_shapes.get(rec_id)
+        if not self._showing_tree() or rows is None or shape is None:
+            return
+        # the rows under the process follow it, in the tree rows and in the
+        # filtered rows, which are found through its ancestors
+        sizes = self._tree_counts(rows)
+        position = self._tree_position(rec_id, sizes) + 1
+        filtered_position = None
+        if self._filtered_rows is not rows:
+            row_filter = self._compile_filter(self._config["filter"])
+            filtered_position = self._tree_position(
+                rec_id, self._tree_filtered_counts(), row_filter
+            ) + row_filter(self._tree_by_id[rec_id])
+
+        parents_end, _, end = shape
+        self._tree_shapes[rec_id] = (
+            parents_end,
+            self._not_expandable(branch, self._tree_by_id),
+            end,
+        )
+        removed = rows[position : position + sizes[rec_id]]
+        for row in removed:
+            del self._tree_shapes[row[1][0]]
+            del self._tree_parents[row[1][0]]
+            del sizes[row[1][0]]
+        added: List[InternalRow] = []
+        if branch[0]:
+            added = self._flatten_branch(
+                rec_id,
+                branch[1],
+                parents_end + (end,),
+                rows=self._tree_by_id,
+                sort_key=self._sort_key(),
+                levels=self._tree_levels,
+                shapes=self._tree_shapes,
+            )
+            self._index_branch(rec_id, added, sizes)
+        rows[position : position + len(removed)] = added
+        self._resize_branch(rec_id, sizes, len(added) - len(removed))
+        self._forget_matches()
 
-        return sorted_rows
+        if filtered_position is not None:
+            self._splice_filtered(rec_id, filtered_position, removed, added)
+
+    def _splice_filtered(
+        self,
+        rec_id: str,
+        position: int,
+        removed: List[InternalRow],
+        added: List[InternalRow],
+    ) -> None:
+        """Replace the filtered rows under a process, which follow the given
+        position in the filtered rows, after its branch was toggled"""
+        sizes = self._tree_filtered_counts()
+        removed_count = sizes[rec_id]
+        for row in removed:
+            del sizes[row[1][0]]
+        sizes.update(self._count_filtered(rec_id, added))
+        added = self._filter_rows(added)
+        self._filtered_rows[position : position + removed_count] = added
+        self._resize_branch(rec_id, sizes, len(added) - removed_count)
+
+    def _branch_spans(
+        self, parent_id: Optional[str], rows: List[InternalRow]
+    ) -> Iterator[Tuple[str, Optional[str], int, int]]:
+        """The id and parent of each of the rows under a branch of the tree,
+        which are given in the order they are displayed, and the range of
+        the rows under it"""
+        # the ancestors of the current row under the branch, with
+        # their parents and positions
+        ancestors: List[Tuple[str, Optional[str], int]] = []
+        base = len(self._tree_shapes[rows[0][1][0]][0]) if rows else 0
+        for i, row in enumerate(rows):
+            rec_id = row[1][0]
+            while len(ancestors) > len(self._tree_shapes[rec_id][0]) - base:
+                ancestor, parent, start = ancestors.pop()
+                yield ancestor, parent, start + 1, i
+            parent = ancestors[-1][0] if ancestors else parent_id
+            ancestors.append((rec_id, parent, i))
+        while ancestors:
+            ancestor, parent, start = ancestors.pop()
+            yield ancestor, parent, start + 1, len(rows)
+
+    def _index_branch(
+        self, parent_id: Optional[str], rows: List[InternalRow], sizes: Dict[str, int]
+    ) -> None:
+        """Record the parent of each of the rows under a branch of
+        the tree, and the number of rows under each of them"""
+        for rec_id, parent, start, end in self._branch_spans(parent_id, rows):
+            self._tree_parents[rec_id] = parent
+            sizes[rec_id] = end - start
+
+    def _tree_counts(self, rows: List[InternalRow]) -> Dict[str, int]:
+        """The number of rows under each row of the tree, which is counted
+        along with the parent of each row the first time it is needed
+        after the tree is flattened"""
+        if self._tree_sizes is None:
+            self._tree_parents = {}
+            self._tree_sizes = {}
+            self._index_branch(None, rows, self._tree_sizes)
+        return self._tree_sizes
+
+    def _count_filtered(
+        self, parent_id: Optional[str], rows: List[InternalRow]
+    ) -> Dict[str, int]:
+        """The number of rows under each of the rows under a branch of the
+        tree which match the filter, given the rows of the branch"""
+        matched = {id(row[1]) for row in self._filter_rows(rows)}
+        before = [0]
+        for row in rows:
+            before.append(before[-1] + (id(row[1]) in matched))
+        return {
+            rec_id: before[end] - before[start]
+            for rec_id, _, start, end in self._branch_spans(parent_id, rows)
+        }
+
+    def _tree_filtered_counts(self) -> Dict[str, int]:
+        """The number of rows under each row of the tree which match the
+        filter, which is counted the first time it is needed after the
+        rows are filtered"""
+        if self._tree_filtered_sizes is None:
+            assert self._tree_rows is not None
+            self._tree_filtered_sizes = self._count_filtered(None, self._tree_rows)
+        return self._tree_filtered_sizes
+
+    def _tree_position(
+        self,
+        rec_id: str,
+        sizes: Dict[str, int],
+        row_filter: Optional[RowFilter] = None,
+    ) -> int:
+        """The number of rows before a row of the tree, found by walking up
+        its ancestors and counting the rows before it in each level. If a
+        filter is given, only the rows which match it are counted, with the
+        given number of matching rows under each row."""
+        position = 0
+        current = rec_id
+        while True:
+            parent = self._tree_parents[current]
+            level = self._tree_levels.get(parent)
+            if level is not None:
+                for sibling in level[1]:
+                    if sibling == current:
+                        break
+                    position += sizes[sibling] + (
+                        row_filter is None or row_filter(self._tree_by_id[sibling])
+                    )
+            if parent is None:
+                return position
+            position += row_filter is None or row_filter(self._tree_by_id[parent])
+            current = parent
+
+    def _resize_branch(self, rec_id: str, sizes: Dict[str, int], change: int) -> None:
+        """Change the number of rows under a row of the tree and its ancestors"""
+        current: Optional[str] = rec_id
+        while current is not None:
+            sizes[current] += change
+            current = self._tree_parents[current]
+
+    def _sort_children(  # pylint: disable=too-many-arguments
+        self,
+        parent_id: Optional[str],
+        tree: Dict[str, Any],
+        rows: Dict[str, InternalRow],
+        sort_key: Callable[[List[Any]], Any],
+        levels: Dict[Optional[str], Tuple[Tuple, List[str]]],
+    ) -> List[str]:
+        """The ids of the displayed children of a level of the tree in
+        sorted order. A level is only sorted again if its children or
+        their sort keys have changed since it was last sorted."""
+        children = [rec_id for rec_id in tree if rec_id in rows]
+        if len(children) < 2:
+            levels.pop(parent_id, None)
+            return children
+        signature = (children, [sort_key(rows[rec_id][1]) for rec_id in children])
+        cached = self._tree_levels.get(parent_id)
+        if cached is None or cached[0] != signature:
+            level = self._simple_sort([rows[rec_id] for rec_id in children])
+            cached = (signature, [row[1][0] for row in level])
+        levels[parent_id] = cached
+        return cached[1]
+
+    def _sort_key(self) -> Callable[[List[Any]], Any]:
+        """Gets the values of a sortable row which it is sorted by"""
+        col_names = [_.header_name for _ in self.columns]
+        indices = [col_names.index("PID")] if "PID" in col_names else []
+        key = self._config["sort_column"]
+        if key in col_names:
+            indices.append(col_names.index(key))
+        if len(indices) == 0:
+            return lambda row: None
+        return itemgetter(*indices)
+
+    def _tree_prefix(self, rec_id: str) -> str:
+        """The prefix showing the branches of the tree before a row"""
+        shape = self._tree_shapes.get(rec_id)
+        if shape is None:
+            return ""
+        parents_end, not_expandable, end = shape
+        return self._make_tree_prefix(
+            len(parents_end), not_expandable, end, parents_end
+        )
 
     def _simple_sort(self, rows: List[InternalRow]) -> List[InternalRow]:
         """Sort a list of rows by a key, putting all Nones at the end."""
@@ -493,7 +902,7 @@ class Table(Widget):  # pylint: disable=too-many-instance-attributes
 
     @staticmethod
     def _make_tree_prefix(
-        depth: int, not_expandable: bool, end: bool, parents_end: List[bool]
+        depth: int, not_expandable: bool, end: bool, parents_end: Sequence[bool]
     ) -> str:
         """Constructs a prefix for the row showing the tree structure"""
         if depth == 0: